@@ -1,16 +1,34 @@
 import os
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, g, Response, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import escape
 import openai
 import datetime
 from datetime import date, timedelta
 import random
 import math
+import threading
+import uuid
+import hashlib
+import hmac
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import json
+import csv
+import secrets
+import click
+import re
+from collections import OrderedDict
+from itertools import accumulate
+from bisect import bisect_left, bisect_right
 from sqlalchemy import func, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.attributes import set_committed_value
 
 # --- Configuration ---
 app = Flask(__name__)
@@ -20,11 +38,49 @@ CORS(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///life_rpg.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Serve /api/stats lifetime totals from the maintained user_counter row instead of scanning history
+app.config['STATS_COUNTERS'] = os.environ.get('STATS_COUNTERS', 'true').lower() != 'false'
+# Background pool for OpenAI calls; jobs beyond the pending cap are refused rather than queued forever
+app.config['AI_WORKERS'] = int(os.environ.get('AI_WORKERS', 4))
+app.config['AI_MAX_PENDING_JOBS'] = int(os.environ.get('AI_MAX_PENDING_JOBS', 32))
+# Local response cache for repeatable AI prompts (quest generation and enhancement)
+app.config['AI_CACHE_PATH'] = os.environ.get('AI_CACHE_PATH', os.path.join(app.instance_path, 'ai_cache.sqlite3'))
+app.config['AI_CACHE_TTL'] = int(os.environ.get('AI_CACHE_TTL', 7 * 24 * 3600))
+app.config['AI_CACHE_MAX_ENTRIES'] = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 5000))
+# Cached answers are only served to an API key that made a successful OpenAI call this recently
+app.config['AI_KEY_VALIDATION_TTL'] = int(os.environ.get('AI_KEY_VALIDATION_TTL', 3600))
+# Server-sent event streams end after this long; EventSource reconnects and resumes via Last-Event-ID
+app.config['EVENT_STREAM_SECONDS'] = int(os.environ.get('EVENT_STREAM_SECONDS', 55))
+# Open streams each hold a worker thread; beyond this many per process, tabs fall back to polling
+app.config['EVENT_STREAMS_PER_WORKER'] = int(os.environ.get('EVENT_STREAMS_PER_WORKER', 4))
+# Per-process cache of the identity Flask-Login loads on every request; 0 disables it
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 300))
+app.config['USER_CACHE_MAX_ENTRIES'] = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+# A historical XP read that scans more ledger rows than this stores a snapshot at its date
+app.config['XP_SNAPSHOT_EVERY'] = int(os.environ.get('XP_SNAPSHOT_EVERY', 500))
+# Bearer token required to scrape /metrics; without one the endpoint is a 404 unless METRICS_PUBLIC=true
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['METRICS_PUBLIC'] = os.environ.get('METRICS_PUBLIC', 'false').lower() == 'true'
 
 # Handle Railway PostgreSQL URL format
 if app.config['SQLALCHEMY_DATABASE_URI'].startswith("postgres://"):
     app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace("postgres://", "postgresql://", 1)
 
+# Connection pool per worker process: one connection for each request thread
+# (GUNICORN_THREADS, shared with gunicorn.conf.py) plus overflow for the AI
+# job threads and the event streams' brief polls. Railway's proxy drops idle
+# connections, hence pre-ping and recycling well inside its idle timeout.
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 8))),
+        'max_overflow': int(os.environ.get(
+            'DB_MAX_OVERFLOW', app.config['AI_WORKERS'] + app.config['EVENT_STREAMS_PER_WORKER']
+        )),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),
+        'pool_pre_ping': True
+    }
+
 # Initialize extensions
 db = SQLAlchemy(app)
 login_manager = LoginManager()
@@ -68,6 +124,10 @@ class User(UserMixin, db.Model):
     notes = db.relationship('Note', backref='user', lazy=True, cascade='all, delete-orphan')
     daily_checklist_items = db.relationship('DailyChecklistItem', backref='user', lazy=True, cascade='all, delete-orphan')
     daily_checklist_logs = db.relationship('DailyChecklistLog', backref='user', lazy=True, cascade='all, delete-orphan')
+    counters = db.relationship('UserCounter', backref='user', uselist=False, cascade='all, delete-orphan')
+    data_version = db.relationship('UserDataVersion', backref='user', uselist=False, cascade='all, delete-orphan')
+    xp_events = db.relationship('XpEvent', backref='user', lazy=True, cascade='all, delete-orphan')
+    xp_snapshots = db.relationship('XpSnapshot', backref='user', lazy=True, cascade='all, delete-orphan')
 
 class Attribute(db.Model):
     attribute_id = db.Column(db.Integer, primary_key=True)
@@ -109,10 +169,20 @@ class Task(db.Model):
     numeric_unit = db.Column(db.String(50), nullable=True)
     logged_numeric_value = db.Column(db.Float, nullable=True)
     negative_habit_done = db.Column(db.Boolean, default=None)  # ADDED: For negative habit tracking
+    # Template this task was materialized from (NULL for manually added tasks)
+    recurring_task_id = db.Column(db.Integer, db.ForeignKey('recurring_task.recurring_task_id', ondelete='SET NULL'))
     
     # Relationships
     attribute = db.relationship('Attribute', backref='tasks')
     subskill = db.relationship('Subskill', backref='tasks')
+    
+    __table_args__ = (
+        # One instance per recurring template per day; NULLs (manual tasks) never collide.
+        # Its (user_id, date) prefix also serves every per-day task lookup.
+        db.Index('uq_task_user_date_recurring', 'user_id', 'date', 'recurring_task_id', unique=True),
+        db.Index('ix_task_user_description_date', 'user_id', 'description', 'date'),
+        db.Index('ix_task_user_completed_negative', 'user_id', 'is_completed', 'is_negative_habit'),
+    )
         
 class Quest(db.Model):
     quest_id = db.Column(db.Integer, primary_key=True)
@@ -129,13 +199,17 @@ class Quest(db.Model):
     due_date = db.Column(db.String(10))
     completed_date = db.Column(db.String(10))
     
-    steps = db.relationship('QuestStep', backref='quest', lazy='dynamic', cascade='all, delete-orphan')
+    steps = db.relationship('QuestStep', backref='quest', lazy=True, order_by='QuestStep.id', cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_quest_user_status', 'user_id', 'status'),)
 
 class QuestStep(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quest_id = db.Column(db.Integer, db.ForeignKey('quest.quest_id'), nullable=False)
     description = db.Column(db.Text, nullable=False)
     is_completed = db.Column(db.Boolean, default=False)
+    
+    __table_args__ = (db.Index('ix_quest_step_quest', 'quest_id', 'id'),)
 
 # NEW: Missing NarrativeProgress model
 class NarrativeProgress(db.Model):
@@ -162,6 +236,8 @@ class Note(db.Model):
     content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_note_user_updated', 'user_id', 'updated_at'),)
 
 class DailyChecklistItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -176,7 +252,10 @@ class DailyChecklistLog(db.Model):
     date = db.Column(db.String(10), nullable=False)
     status = db.Column(db.String(20), nullable=False)  # e.g., 'completed', 'missed'
     item = db.relationship('DailyChecklistItem')
-    __table_args__ = (db.UniqueConstraint('item_id', 'date', 'user_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('item_id', 'date', 'user_id'),
+        db.Index('ix_checklist_log_user_date', 'user_id', 'date'),
+    )
 
 class Milestone(db.Model):
     milestone_id = db.Column(db.Integer, primary_key=True)
@@ -189,6 +268,8 @@ class Milestone(db.Model):
     
     # Relationship to access attribute object
     attribute = db.relationship('Attribute', backref='milestones')
+    
+    __table_args__ = (db.Index('ix_milestone_user_date', 'user_id', 'date', 'milestone_id'),)
 
 class DailyNarrative(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -196,7 +277,10 @@ class DailyNarrative(db.Model):
     date = db.Column(db.String(10), nullable=False)
     narrative = db.Column(db.Text, nullable=False)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'date'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date'),
+        db.Index('ix_daily_narrative_user_date', 'user_id', 'date', 'id'),
+    )
 
 class RecurringTask(db.Model):
     recurring_task_id = db.Column(db.Integer, primary_key=True)
@@ -236,78 +320,1231 @@ class CharacterStat(db.Model):
     
     __table_args__ = (db.UniqueConstraint('user_id', 'stat_name'),)
 
+class UserCounter(db.Model):
+    """Running lifetime totals for /api/stats, updated alongside the rows they count"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    tasks_completed = db.Column(db.Integer, default=0, nullable=False)
+    negative_habits_done = db.Column(db.Integer, default=0, nullable=False)
+    negative_habits_avoided = db.Column(db.Integer, default=0, nullable=False)
+    active_quests = db.Column(db.Integer, default=0, nullable=False)
+    completed_quests = db.Column(db.Integer, default=0, nullable=False)
+
+class XpEvent(db.Model):
+    """Append-only ledger of XP changes; Attribute/Subskill.current_xp are its running totals.
+
+    Attribute XP rows leave subskill_id NULL; subskill XP rows carry both ids.
+    `date` is the game day the XP belongs to (the task's date), not when it was written.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    attribute_id = db.Column(db.Integer, db.ForeignKey('attribute.attribute_id'), nullable=False)
+    subskill_id = db.Column(db.Integer, db.ForeignKey('subskill.subskill_id'))
+    source = db.Column(db.String(20), nullable=False)  # task, task_deleted, day_reset, quest, opening, reconcile
+    source_id = db.Column(db.Integer)
+    delta = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_xp_event_user_date', 'user_id', 'date'),)
+
+class XpSnapshot(db.Model):
+    """A user's XP totals over every ledger event dated on or before `date`"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.String(10), nullable=False)
+    totals = db.Column(db.Text, nullable=False)  # JSON: {"attributes": {id: xp}, "subskills": {id: xp}}
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'date'),)
+
+class UserDataVersion(db.Model):
+    """Monotonic counter bumped by every write to a user's data; the basis of API ETags"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class UserEvent(db.Model):
+    """Short-lived log of state deltas fanned out to the user's open /api/events streams"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_user_event_user_id', 'user_id', 'id'),)
+
+class BackgroundJob(db.Model):
+    """A unit of work run on the AI worker pool; its row is what clients poll"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    date = db.Column(db.String(10))
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, error
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_background_job_user_kind_date', 'user_id', 'kind', 'date'),)
+
+# --- User Identity Cache ---
+class UserIdentity(UserMixin):
+    """The parts of a User a request needs: id for queries, username for the page.
+
+    A plain object rather than the ORM row, so it can outlive the session that
+    loaded it and be shared between request threads.
+    """
+    __slots__ = ('id', 'username', 'email')
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email)
+
+class UserIdentityCache:
+    """TTL-bounded LRU of UserIdentity by id, local to this worker process.
+
+    Any ORM update or delete of a User invalidates its entry here (see the
+    listeners below). Other worker processes keep their copy until the TTL
+    runs out, which bounds how long a renamed or deleted user can be seen.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evicted': 0}
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def put(self, identity):
+        if self.ttl <= 0:
+            return identity
+        with self.lock:
+            self.entries[identity.id] = (identity, time.monotonic() + self.ttl)
+            self.entries.move_to_end(identity.id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evicted'] += 1
+        return identity
+
+    def invalidate(self, user_id):
+        with self.lock:
+            if self.entries.pop(user_id, None) is not None:
+                self.counters['invalidations'] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'entries': len(self.entries),
+                'ttl': self.ttl,
+                'hit_rate': round(self.counters['hits'] / lookups, 3) if lookups else None
+            }
+
+user_cache = UserIdentityCache(app.config['USER_CACHE_TTL'], app.config['USER_CACHE_MAX_ENTRIES'])
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    """Profile, password or account changes must not be served from a stale entry"""
+    user_cache.invalidate(target.id)
+
 # --- Login Manager ---
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# --- Helper Functions ---
-def calculate_exp_for_level(level):
+    user_id = int(user_id)
+    identity = user_cache.get(user_id)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = user_cache.put(UserIdentity.from_user(user))
+    return identity
+
+# --- Level Curve ---
+# The curve is defined by the two formula functions; everything else reads the
+# precomputed tables built from them once at import.
+MAX_TABLE_LEVEL = 1000
+
+def exp_for_level_formula(level):
     if level <= 1: return 0
     return int(100 * (level - 1) ** 2.2)
 
-def calculate_level_from_exp(exp):
+def level_from_exp_formula(exp):
     if exp is None or exp <= 0: return 1
     return int(1 + (exp / 100) ** (1/2.2))
 
-def generate_ai_response(prompt, system_message, api_key):
-    """Generate AI response using user's API key"""
+def build_level_thresholds(max_level):
+    """Smallest integer XP at which level_from_exp_formula reaches each level.
+
+    Index i holds the threshold for level i + 1. Float truncation means this can
+    differ by a point from exp_for_level_formula, so it is searched, not derived.
+    """
+    thresholds = [0]
+    for level in range(2, max_level + 1):
+        xp = max(exp_for_level_formula(level), thresholds[-1] + 1)
+        while xp - 1 > thresholds[-1] and level_from_exp_formula(xp - 1) >= level:
+            xp -= 1
+        while level_from_exp_formula(xp) < level:
+            xp += 1
+        thresholds.append(xp)
+    return thresholds
+
+LEVEL_THRESHOLDS = build_level_thresholds(MAX_TABLE_LEVEL)
+LEVEL_EXP = [exp_for_level_formula(level) for level in range(MAX_TABLE_LEVEL + 2)]
+
+def calculate_exp_for_level(level):
+    if level <= MAX_TABLE_LEVEL + 1:
+        return LEVEL_EXP[max(level, 0)]
+    return exp_for_level_formula(level)
+
+def calculate_level_from_exp(exp):
+    if exp is None or exp <= 0: return 1
+    if exp >= LEVEL_THRESHOLDS[-1]:
+        return level_from_exp_formula(exp)
+    return bisect_right(LEVEL_THRESHOLDS, exp)
+
+def level_progress_batch(xp_values):
+    """Map XP totals to level and progress-bar fields in one pass over the tables"""
+    results = []
+    for xp in xp_values:
+        level = calculate_level_from_exp(xp)
+        current_level_xp = calculate_exp_for_level(level)
+        xp_needed = calculate_exp_for_level(level + 1) - current_level_xp
+        xp_progress = xp - current_level_xp
+        results.append({
+            'level': level,
+            'total_xp': xp,
+            'xp_progress': xp_progress,
+            'xp_needed': xp_needed,
+            'progress_percent': (xp_progress / xp_needed * 100) if xp_needed > 0 else 100
+        })
+    return results
+
+# --- Helper Functions ---
+
+AI_MODEL = "gpt-4o-mini"
+AI_MAX_TOKENS = 500
+
+class AIResponseCache:
+    """Content-addressed store of AI responses in a local SQLite file.
+
+    Entries are keyed on a hash of (model, max tokens, system message, prompt),
+    expire after ttl seconds, and the least recently used ones are evicted once
+    the table holds more than max_entries. Each process keeps one connection.
+    
+    The file also remembers which API keys recently made a successful call
+    (as keyed hashes, valid for key_ttl seconds), so a missing or revoked
+    key is not answered from the cache.
+    """
+    def __init__(self, path, ttl, max_entries, key_ttl):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key_ttl = key_ttl
+        self.lock = threading.Lock()
+        self.connection = None
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'stored': 0, 'unvalidated_key': 0}
+
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS ai_response ('
+                'key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS ix_ai_response_last_used ON ai_response (last_used_at)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS validated_key (fingerprint TEXT PRIMARY KEY, validated_at REAL NOT NULL)'
+            )
+        return self.connection
+
+    @staticmethod
+    def key_fingerprint(api_key):
+        return hmac.new(app.config['SECRET_KEY'].encode('utf-8'), api_key.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def key_validated(self, api_key):
+        """Whether api_key made a successful OpenAI call within the last key_ttl seconds"""
+        if not api_key:
+            return False
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT validated_at FROM validated_key WHERE fingerprint = ?', (self.key_fingerprint(api_key),)
+            ).fetchone()
+        return row is not None and row[0] >= time.time() - self.key_ttl
+
+    def mark_key_validated(self, api_key):
+        if not api_key:
+            return
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO validated_key (fingerprint, validated_at) VALUES (?, ?)',
+                (self.key_fingerprint(api_key), now)
+            )
+            connection.execute('DELETE FROM validated_key WHERE validated_at < ?', (now - self.key_ttl,))
+
+    def skip_unvalidated(self):
+        with self.lock:
+            self.counters['unvalidated_key'] += 1
+
+    @staticmethod
+    def make_key(model, max_tokens, system_message, prompt):
+        payload = json.dumps([model, max_tokens, system_message, prompt])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT response, created_at FROM ai_response WHERE key = ?', (key,)).fetchone()
+            if row and row[1] < now - self.ttl:
+                connection.execute('DELETE FROM ai_response WHERE key = ?', (key,))
+                self.counters['expired'] += 1
+                row = None
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            connection.execute('UPDATE ai_response SET last_used_at = ? WHERE key = ?', (now, key))
+            self.counters['hits'] += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO ai_response (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)',
+                (key, response, now, now)
+            )
+            self.counters['stored'] += 1
+            evicted = connection.execute(
+                'DELETE FROM ai_response WHERE key IN ('
+                'SELECT key FROM ai_response ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            ).rowcount
+            self.counters['evicted'] += max(evicted, 0)
+
+    def stats(self):
+        with self.lock:
+            entries = self.connect().execute('SELECT COUNT(*) FROM ai_response').fetchone()[0]
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'entries': entries,
+                'hit_rate': round(self.counters['hits'] / lookups, 3) if lookups else None
+            }
+
+ai_cache = AIResponseCache(
+    app.config['AI_CACHE_PATH'], app.config['AI_CACHE_TTL'], app.config['AI_CACHE_MAX_ENTRIES'],
+    app.config['AI_KEY_VALIDATION_TTL']
+)
+
+def generate_ai_response(prompt, system_message, api_key, use_cache=False):
+    """Generate AI response using user's API key.
+
+    With use_cache, an identical earlier request is answered from ai_cache
+    without a network call, provided api_key itself made a successful call
+    within AI_KEY_VALIDATION_TTL. Any other key goes to OpenAI, so a missing
+    or revoked key fails the same way with or without a cached answer.
+    Errors are never cached.
+    """
+    cache_key = AIResponseCache.make_key(AI_MODEL, AI_MAX_TOKENS, system_message, prompt) if use_cache else None
+    if cache_key:
+        if ai_cache.key_validated(api_key):
+            cached = ai_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        else:
+            ai_cache.skip_unvalidated()
+    
+    started = time.perf_counter()
     try:
-        openai.api_key = api_key
+        # Pass the key per call: worker threads serve different users concurrently
         response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
+            api_key=api_key,
+            model=AI_MODEL,
             messages=[
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=500
+            max_tokens=AI_MAX_TOKENS
         )
-        return response.choices[0].message.content.strip()
+        text_response = response.choices[0].message.content.strip()
     except Exception as e:
+        ai_request_seconds.observe(time.perf_counter() - started, call='generate', outcome='error')
         print(f"Error with AI generation: {e}")
         return f"AI Error: {str(e)}"
+    ai_request_seconds.observe(time.perf_counter() - started, call='generate', outcome='ok')
+    
+    ai_cache.mark_key_validated(api_key)
+    if cache_key:
+        ai_cache.put(cache_key, text_response)
+    return text_response
+
+def provision_users(user_ids):
+    """Create the default attributes, subskills, stats and story rows for new users.
+
+    Bulk inserts, one per table, so onboarding a single registration or a
+    whole team import costs the same handful of statements. The caller
+    commits.
+    """
+    if not user_ids:
+        return
+    attributes = db.session.execute(
+        db.insert(Attribute).returning(Attribute.attribute_id, Attribute.name),
+        [{'user_id': user_id, 'name': attr_name, 'description': f"Your {attr_name} attribute", 'current_xp': 0}
+         for user_id in user_ids for attr_name in ATTRIBUTES]
+    ).all()
+    db.session.execute(db.insert(Subskill), [
+        {'attribute_id': attribute_id, 'name': sub_name, 'current_xp': 0}
+        for attribute_id, attr_name in attributes for sub_name in ATTRIBUTES[attr_name]
+    ])
+    db.session.execute(db.insert(NarrativeProgress), [{'user_id': user_id} for user_id in user_ids])
+    db.session.execute(db.insert(Credo), [{'user_id': user_id} for user_id in user_ids])
+    db.session.execute(db.insert(CharacterStat), [
+        {'user_id': user_id, 'stat_name': 'Stress', 'value': 0} for user_id in user_ids
+    ])
+    # New users have no history, so their stats counters start at zero
+    db.session.execute(db.insert(UserCounter), [{'user_id': user_id} for user_id in user_ids])
 
 def initialize_user_data(user):
     """Initialize default attributes and stats for a new user"""
-    # Create default attributes
-    for attr_name, sub_list in ATTRIBUTES.items():
-        attribute = Attribute(
-            user_id=user.id,
-            name=attr_name,
-            description=f"Your {attr_name} attribute",
-            current_xp=0
+    provision_users([user.id])
+
+def dialect_insert(model):
+    """Return an INSERT for the bound dialect so callers can use ON CONFLICT clauses"""
+    dialects = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+    return dialects.get(db.engine.dialect.name, db.insert)(model)
+
+def materialize_recurring_tasks(user_id, date):
+    """Create the day's instances of active recurring tasks in one set-based pass.
+
+    A single anti-join query returns the templates whose watermark
+    (last_added_date) is not yet this date, flagged with whether an instance
+    already exists. Missing instances are bulk inserted, relying on the
+    (user_id, date, recurring_task_id) unique index to absorb concurrent loads,
+    and the watermarks are advanced so the next load of this date finds nothing.
+    """
+    instance_exists = db.session.query(Task.task_id).filter(
+        Task.user_id == user_id,
+        Task.date == date,
+        db.or_(
+            Task.recurring_task_id == RecurringTask.recurring_task_id,
+            Task.description == RecurringTask.description
         )
-        db.session.add(attribute)
-        db.session.flush()  # Get the ID
-        
-        # Create subskills
-        for sub_name in sub_list:
-            subskill = Subskill(
-                attribute_id=attribute.attribute_id,
-                name=sub_name,
-                current_xp=0
-            )
-            db.session.add(subskill)
+    ).exists()
+
+    pending = db.session.query(RecurringTask, instance_exists).filter(
+        RecurringTask.user_id == user_id,
+        RecurringTask.is_active == True,
+        RecurringTask.start_date <= date,
+        db.or_(RecurringTask.last_added_date.is_(None), RecurringTask.last_added_date != date)
+    ).all()
+
+    if not pending:
+        return 0
+
+    new_tasks = [{
+        'user_id': user_id,
+        'date': date,
+        'description': rt.description,
+        'task_type': 'recurring',
+        'recurring_task_id': rt.recurring_task_id,
+        'attribute_id': rt.attribute_id,
+        'subskill_id': rt.subskill_id,
+        'xp_gained': rt.xp_value,
+        'stress_effect': rt.stress_effect,
+        'is_negative_habit': rt.is_negative_habit,
+        'numeric_value': rt.numeric_value,
+        'numeric_unit': rt.numeric_unit
+    } for rt, exists in pending if not exists]
+    advanced_ids = [rt.recurring_task_id for rt, _ in pending
+                    if rt.last_added_date is None or rt.last_added_date < date]
+
+    if not new_tasks and not advanced_ids:
+        return 0
+
+    if new_tasks:
+        stmt = dialect_insert(Task)
+        if hasattr(stmt, 'on_conflict_do_nothing'):
+            stmt = stmt.on_conflict_do_nothing(index_elements=['user_id', 'date', 'recurring_task_id'])
+        db.session.execute(stmt, new_tasks)
+
+    # Watermark only moves forward so "Last auto-added" keeps showing the latest day
+    if advanced_ids:
+        RecurringTask.query.filter(RecurringTask.recurring_task_id.in_(advanced_ids)).update(
+            {'last_added_date': date}, synchronize_session=False
+        )
+    if new_tasks:
+        bump_data_version(user_id)
 
-    # Create narrative progress
-    narrative_progress = NarrativeProgress(user_id=user.id)
-    db.session.add(narrative_progress)
-    
-    # Create default credo
-    credo = Credo(user_id=user.id)
-    db.session.add(credo)
-    
     db.session.commit()
-    
-    # Create default character stats
-    stress_stat = CharacterStat(
-        user_id=user.id,
-        stat_name='Stress',
-        value=0
+    return len(new_tasks)
+
+# --- Background Jobs ---
+JOB_STALE_AFTER = datetime.timedelta(minutes=5)
+JOB_RETENTION = datetime.timedelta(days=1)
+
+job_executor = ThreadPoolExecutor(max_workers=app.config['AI_WORKERS'], thread_name_prefix='ai-job')
+job_lock = threading.Lock()
+pending_jobs = {}  # (kind, user_id, date) -> job id, for jobs queued by this process
+
+def submit_job(kind, user_id, date, fn, *args):
+    """Queue fn(*args) on the worker pool and return its BackgroundJob.
+
+    A request for a (kind, user, date) that already has an unfinished job
+    returns that job instead of starting another. Returns None when the
+    pool already has AI_MAX_PENDING_JOBS waiting.
+    """
+    key = (kind, user_id, date)
+    now = datetime.datetime.utcnow()
+    with job_lock:
+        if key in pending_jobs:
+            return db.session.get(BackgroundJob, pending_jobs[key])
+        
+        # Another gunicorn worker may already be running it
+        existing = BackgroundJob.query.filter(
+            BackgroundJob.user_id == user_id,
+            BackgroundJob.kind == kind,
+            BackgroundJob.date == date,
+            BackgroundJob.status.in_(['queued', 'running']),
+            BackgroundJob.created_at > now - JOB_STALE_AFTER
+        ).first()
+        if existing:
+            return existing
+        
+        if len(pending_jobs) >= app.config['AI_MAX_PENDING_JOBS']:
+            return None
+        
+        BackgroundJob.query.filter(
+            BackgroundJob.user_id == user_id,
+            BackgroundJob.created_at < now - JOB_RETENTION
+        ).delete(synchronize_session=False)
+        job = BackgroundJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, date=date, status='queued')
+        db.session.add(job)
+        db.session.commit()
+        pending_jobs[key] = job.id
+    
+    job_executor.submit(run_job, job.id, key, fn, args)
+    return job
+
+def run_job(job_id, key, fn, args):
+    """Worker-thread entry point: run fn inside an app context and record the outcome"""
+    with app.app_context():
+        # Every status write is conditional: a job expire_stale_job already
+        # failed stays failed, however late its worker starts or finishes
+        unfinished = BackgroundJob.query.filter(
+            BackgroundJob.id == job_id, BackgroundJob.status.in_(['queued', 'running'])
+        )
+        try:
+            claimed = unfinished.update({'status': 'running'}, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                return
+            result = fn(*args)
+            # Matches nothing if the job was failed while it ran; fn's own
+            # writes are committed either way, so the version is still bumped
+            unfinished.update({'status': 'done', 'result': json.dumps(result)}, synchronize_session=False)
+            bump_data_version(key[1])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Background job {job_id} failed: {e}")
+            unfinished.update({'status': 'error', 'error': str(e)}, synchronize_session=False)
+            db.session.commit()
+        finally:
+            with job_lock:
+                pending_jobs.pop(key, None)
+
+def expire_stale_job(job):
+    """Fail a job still unfinished after JOB_STALE_AFTER: its worker was killed, recycled or redeployed"""
+    if job.status in ('queued', 'running') and job.created_at < datetime.datetime.utcnow() - JOB_STALE_AFTER:
+        error = 'The job was interrupted before it finished. Please try again.'
+        # Conditional, so a worker that finishes at the same moment keeps its result
+        BackgroundJob.query.filter(
+            BackgroundJob.id == job.id, BackgroundJob.status.in_(['queued', 'running'])
+        ).update({'status': 'error', 'error': error}, synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(job)
+    return job
+
+def serialize_job(job):
+    return {
+        'job_id': job.id,
+        'kind': job.kind,
+        'date': job.date,
+        'status': job.status,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error
+    }
+
+# --- Keyset Pagination ---
+# History lists page newest-first on (date, id). A cursor names the last row
+# of the previous page, so every page is one index range read no matter how
+# deep it is; nothing is counted unless the caller asks for a total.
+PAGE_MAX_LIMIT = 50
+
+def encode_cursor(date, row_id):
+    return f"{date}_{row_id}"
+
+def decode_cursor(cursor):
+    """(date, id) from a cursor, or None for the first page; ValueError if malformed"""
+    if not cursor:
+        return None
+    date, row_id = cursor.rsplit('_', 1)
+    return datetime.date.fromisoformat(date).isoformat(), int(row_id)
+
+def keyset_page(query, date_column, id_column, cursor, limit):
+    """Rows after `cursor` in (date, id) descending order, plus the cursor for the next page"""
+    limit = min(max(limit, 1), PAGE_MAX_LIMIT)
+    position = decode_cursor(cursor)
+    if position:
+        query = query.where(db.tuple_(date_column, id_column) < position)
+    rows = db.session.execute(
+        query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1)
+    ).scalars().all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, date_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+# --- Stats Counters ---
+def count_where(condition):
+    return func.coalesce(func.sum(db.case((condition, 1), else_=0)), 0)
+
+def task_counter_totals(*criteria):
+    """Task-derived user_counter columns aggregated over the tasks matching criteria"""
+    completed_negative = db.and_(Task.is_completed == True, Task.is_negative_habit == True)
+    return db.select(
+        count_where(Task.is_completed == True).label('tasks_completed'),
+        count_where(db.and_(completed_negative, Task.negative_habit_done == True)).label('negative_habits_done'),
+        count_where(db.and_(completed_negative, Task.negative_habit_done == False)).label('negative_habits_avoided')
+    ).where(*criteria)
+
+def counter_totals(user_id):
+    """Every user_counter column in one query, computed from the user's full history"""
+    task_totals = task_counter_totals(Task.user_id == user_id).subquery()
+    quest_totals = db.select(
+        count_where(Quest.status == 'Active').label('active_quests'),
+        count_where(Quest.status == 'Completed').label('completed_quests')
+    ).where(Quest.user_id == user_id).subquery()
+    # Both sides are single-row aggregates, so the cross join yields one row
+    return db.select(task_totals, quest_totals).select_from(task_totals.join(quest_totals, db.true()))
+
+def rebuild_user_counters(user_id):
+    """Recompute a user's counters row from history, creating it if missing"""
+    totals = dict(db.session.execute(counter_totals(user_id)).mappings().one())
+    stmt = dialect_insert(UserCounter).values(user_id=user_id, **totals)
+    if hasattr(stmt, 'on_conflict_do_update'):
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id'], set_=totals)
+    db.session.execute(stmt)
+    return totals
+
+def bump_counters(user_id, **deltas):
+    """Adjust counters in SQL within the caller's transaction.
+
+    A user without a counters row is skipped; the row is rebuilt from
+    history on the next stats read.
+    """
+    changes = {getattr(UserCounter, name): getattr(UserCounter, name) + delta
+               for name, delta in deltas.items() if delta}
+    if changes:
+        UserCounter.query.filter_by(user_id=user_id).update(changes, synchronize_session=False)
+
+def completion_deltas(task, sign=1):
+    """Counter deltas contributed by a completed task (sign=-1 to remove them)"""
+    if not task.is_completed:
+        return {}
+    deltas = {'tasks_completed': sign}
+    if task.is_negative_habit and task.negative_habit_done is not None:
+        deltas['negative_habits_done' if task.negative_habit_done else 'negative_habits_avoided'] = sign
+    return deltas
+
+# --- Daily Rollups ---
+# DailyStat is a per-day rollup of Task: how many tasks were completed
+# successfully on that date and the XP they earned. Completions add to their
+# day with one additive upsert (add_daily_stats); deletes and resets collect
+# the dates they touch and rollup_daily_stats recomputes just those days, so
+# the heatmap always agrees with the tasks behind it.
+TASK_SUCCEEDED = db.and_(Task.is_completed == True, db.or_(
+    db.and_(Task.is_negative_habit == True, Task.negative_habit_done == False),
+    db.and_(Task.is_negative_habit == False,
+            db.or_(Task.numeric_unit.is_(None), Task.logged_numeric_value > 0))
+))
+# Completions credit 25 XP when the task has none of its own
+TASK_CREDITED_XP = func.coalesce(func.nullif(Task.xp_gained, 0), 25)
+
+def daily_totals(user_id, dates=None):
+    """{date: (tasks_completed, total_xp_gained)} derived from Task"""
+    query = db.select(
+        Task.date, func.count(Task.task_id), func.sum(TASK_CREDITED_XP)
+    ).where(Task.user_id == user_id, TASK_SUCCEEDED).group_by(Task.date)
+    if dates is not None:
+        query = query.where(Task.date.in_(dates))
+    return {date: (count, xp) for date, count, xp in db.session.execute(query)}
+
+def upsert_daily_stats(user_id, totals):
+    values = [{'user_id': user_id, 'date': date, 'stress_level': 0,
+               'tasks_completed': count, 'total_xp_gained': xp}
+              for date, (count, xp) in totals.items()]
+    if not values:
+        return
+    stmt = dialect_insert(DailyStat).values(values)
+    if hasattr(stmt, 'on_conflict_do_update'):
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'date'], set_={
+            'tasks_completed': stmt.excluded.tasks_completed,
+            'total_xp_gained': stmt.excluded.total_xp_gained
+        })
+    db.session.execute(stmt)
+
+def rollup_daily_stats(user_id, dates):
+    """Recompute DailyStat for the given dates within the caller's transaction"""
+    totals = dict.fromkeys(set(dates), (0, 0))
+    if totals:
+        totals.update(daily_totals(user_id, totals))
+        upsert_daily_stats(user_id, totals)
+    return totals
+
+def rebuild_daily_stats(user_id):
+    """Recompute every DailyStat row for a user from their task history"""
+    DailyStat.query.filter_by(user_id=user_id).update(
+        {'tasks_completed': 0, 'total_xp_gained': 0}, synchronize_session=False
     )
-    db.session.add(stress_stat)
-    
-    db.session.commit()
+    totals = daily_totals(user_id)
+    upsert_daily_stats(user_id, totals)
+    return totals
+
+def add_daily_stats(user_id, deltas):
+    """Add {date: (tasks, xp)} to DailyStat atomically; returns the new totals per date.
+
+    Concurrent completions on the same day each add their own share, so none
+    is lost and no request races another to insert the day's row.
+    """
+    if not deltas:
+        return {}
+    stmt = dialect_insert(DailyStat).values([
+        {'user_id': user_id, 'date': date, 'stress_level': 0, 'tasks_completed': count, 'total_xp_gained': xp}
+        for date, (count, xp) in deltas.items()
+    ])
+    if not hasattr(stmt, 'on_conflict_do_update'):
+        return rollup_daily_stats(user_id, deltas)
+    stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'date'], set_={
+        'tasks_completed': DailyStat.tasks_completed + stmt.excluded.tasks_completed,
+        'total_xp_gained': DailyStat.total_xp_gained + stmt.excluded.total_xp_gained
+    }).returning(DailyStat.date, DailyStat.tasks_completed, DailyStat.total_xp_gained)
+    return {date: (count, xp) for date, count, xp in db.session.execute(stmt)}
+
+def emit_daily_stats(user_id, totals):
+    for date, (count, xp) in totals.items():
+        emit_event(user_id, 'daily_stat', date=date, count=count, xp=xp)
+
+# --- XP Ledger ---
+# Every XP change goes through add_xp, which moves the current_xp column in
+# SQL and appends the applied delta to XpEvent. Historical totals are read as the
+# latest XpSnapshot on or before a date plus the ledger rows since it;
+# appending events drops the snapshots they make stale.
+def xp_event_row(user_id, target, delta, source, source_id, date):
+    return {
+        'user_id': user_id,
+        'attribute_id': target.attribute_id,
+        'subskill_id': getattr(target, 'subskill_id', None),
+        'source': source,
+        'source_id': source_id,
+        'delta': delta,
+        'date': date
+    }
+
+def append_xp_events(events):
+    """Insert ledger rows in one executemany and drop the snapshots dated on or after them"""
+    if not events:
+        return
+    db.session.execute(db.insert(XpEvent), events)
+    earliest = {}
+    for event in events:
+        if event['date'] < earliest.get(event['user_id'], '9999-12-31'):
+            earliest[event['user_id']] = event['date']
+    for user_id, date in earliest.items():
+        XpSnapshot.query.filter(XpSnapshot.user_id == user_id, XpSnapshot.date >= date).delete(
+            synchronize_session=False
+        )
+
+def increment_xp(target, delta):
+    """Add delta to target's current_xp in one UPDATE and load the result from RETURNING.
+
+    The increment happens in the database, so concurrent awards to the same
+    attribute all land; nothing is read back and written over.
+    """
+    model = type(target)
+    key = db.inspect(model).primary_key[0]
+    new_xp = db.session.execute(
+        db.update(model).where(key == getattr(target, key.key)).values(
+            current_xp=func.coalesce(model.current_xp, 0) + delta
+        ).returning(model.current_xp),
+        execution_options={'synchronize_session': False}
+    ).scalar_one()
+    set_committed_value(target, 'current_xp', new_xp)
+
+def add_xp(user_id, target, amount, source, source_id, date):
+    """Change an Attribute's or Subskill's XP (floored at 0) and record it in the ledger.
+
+    The floor is taken against the loaded value; the column and the ledger
+    move by the same delta either way, so they never disagree.
+    """
+    delta = max(amount, -(target.current_xp or 0))
+    if delta:
+        append_xp_events([xp_event_row(user_id, target, delta, source, source_id, date)])
+        increment_xp(target, delta)
+    return delta
+
+def empty_xp_totals():
+    return {'attributes': {}, 'subskills': {}}
+
+def add_xp_rows(totals, rows):
+    """Fold (attribute_id, subskill_id, xp) rows into totals; returns totals"""
+    for attribute_id, subskill_id, xp in rows:
+        kind, key = ('subskills', subskill_id) if subskill_id is not None else ('attributes', attribute_id)
+        totals[kind][key] = totals[kind].get(key, 0) + (xp or 0)
+    return totals
+
+def xp_ledger_sums(*criteria):
+    return db.select(
+        XpEvent.attribute_id, XpEvent.subskill_id, func.sum(XpEvent.delta), func.count(XpEvent.id)
+    ).where(*criteria).group_by(XpEvent.attribute_id, XpEvent.subskill_id)
+
+def store_xp_snapshots(date, totals_by_user):
+    values = [{'user_id': user_id, 'date': date, 'totals': json.dumps(totals),
+               'created_at': datetime.datetime.utcnow()}
+              for user_id, totals in totals_by_user.items()]
+    if not values:
+        return
+    stmt = dialect_insert(XpSnapshot).values(values)
+    if hasattr(stmt, 'on_conflict_do_update'):
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'date'], set_={
+            'totals': stmt.excluded.totals,
+            'created_at': stmt.excluded.created_at
+        })
+    db.session.execute(stmt)
+
+def xp_as_of(user_id, date):
+    """XP per attribute and subskill over ledger events dated on or before date.
+
+    One snapshot read plus a ledger scan from the snapshot's date. A scan
+    longer than XP_SNAPSHOT_EVERY rows stores its result as a new snapshot
+    (in the caller's transaction) so the next read of that range is short.
+    """
+    snapshot = db.session.execute(
+        db.select(XpSnapshot.date, XpSnapshot.totals).where(
+            XpSnapshot.user_id == user_id, XpSnapshot.date <= date
+        ).order_by(XpSnapshot.date.desc()).limit(1)
+    ).first()
+    totals = empty_xp_totals()
+    criteria = [XpEvent.user_id == user_id, XpEvent.date <= date]
+    if snapshot:
+        for kind, values in json.loads(snapshot.totals).items():
+            totals[kind] = {int(key): xp for key, xp in values.items()}
+        criteria.append(XpEvent.date > snapshot.date)
+    
+    rows = db.session.execute(xp_ledger_sums(*criteria)).all()
+    add_xp_rows(totals, [(attribute_id, subskill_id, xp) for attribute_id, subskill_id, xp, _ in rows])
+    if sum(scanned for *_, scanned in rows) > app.config['XP_SNAPSHOT_EVERY']:
+        store_xp_snapshots(date, {user_id: totals})
+    return totals
+
+def snapshot_xp(date):
+    """Store every user's XP totals as of date from one pass over the ledger"""
+    totals_by_user = {}
+    for user_id, attribute_id, subskill_id, xp in db.session.execute(
+        db.select(XpEvent.user_id, XpEvent.attribute_id, XpEvent.subskill_id, func.sum(XpEvent.delta))
+        .where(XpEvent.date <= date)
+        .group_by(XpEvent.user_id, XpEvent.attribute_id, XpEvent.subskill_id)
+    ):
+        add_xp_rows(totals_by_user.setdefault(user_id, empty_xp_totals()), [(attribute_id, subskill_id, xp)])
+    store_xp_snapshots(date, totals_by_user)
+    return len(totals_by_user)
+
+def xp_drift():
+    """(user_id, attribute_id, subskill_id, drift) for every XP column that disagrees with its ledger"""
+    ledger = db.select(
+        XpEvent.attribute_id, XpEvent.subskill_id, func.sum(XpEvent.delta).label('xp')
+    ).group_by(XpEvent.attribute_id, XpEvent.subskill_id).subquery()
+    attribute_drift = func.coalesce(Attribute.current_xp, 0) - func.coalesce(ledger.c.xp, 0)
+    subskill_drift = func.coalesce(Subskill.current_xp, 0) - func.coalesce(ledger.c.xp, 0)
+    return db.union_all(
+        db.select(Attribute.user_id, Attribute.attribute_id, db.null().label('subskill_id'), attribute_drift.label('drift'))
+        .outerjoin(ledger, db.and_(ledger.c.attribute_id == Attribute.attribute_id, ledger.c.subskill_id.is_(None)))
+        .where(attribute_drift != 0),
+        db.select(Attribute.user_id, Subskill.attribute_id, Subskill.subskill_id, subskill_drift.label('drift'))
+        .join(Attribute, Subskill.attribute_id == Attribute.attribute_id)
+        .outerjoin(ledger, ledger.c.subskill_id == Subskill.subskill_id)
+        .where(subskill_drift != 0)
+    ).subquery()
+
+def reconcile_xp_ledger(connection, source, date):
+    """Append one event per drifted XP column so the ledger sums to it again; returns the count"""
+    drift = xp_drift()
+    appended = connection.execute(db.insert(XpEvent).from_select(
+        ['user_id', 'attribute_id', 'subskill_id', 'source', 'delta', 'date', 'created_at'],
+        db.select(drift.c.user_id, drift.c.attribute_id, drift.c.subskill_id,
+                  db.literal(source), drift.c.drift, db.literal(date), db.literal(datetime.datetime.utcnow()))
+    )).rowcount
+    if appended:
+        connection.execute(db.delete(XpSnapshot).where(XpSnapshot.date >= date))
+    return appended
+
+# --- Serializers ---
+# Each serializer is paired with the loader options for the relationships it
+# reads, so endpoints fetch those in a fixed number of queries instead of
+# lazy-loading them row by row.
+TASK_LOADS = (db.joinedload(Task.attribute), db.joinedload(Task.subskill))
+ATTRIBUTE_LOADS = (db.selectinload(Attribute.subskills),)
+RECURRING_TASK_LOADS = (db.joinedload(RecurringTask.attribute), db.joinedload(RecurringTask.subskill))
+MILESTONE_LOADS = (db.joinedload(Milestone.attribute),)
+QUEST_LOADS = (db.selectinload(Quest.steps),)
+
+def level_progress(xp):
+    """Level and progress-bar fields shared by attributes and subskills"""
+    return level_progress_batch([xp])[0]
+
+def serialize_subskill(subskill):
+    return {'id': subskill.subskill_id, 'name': subskill.name, **level_progress(subskill.current_xp)}
+
+def serialize_attribute(attr):
+    return {
+        'id': attr.attribute_id,
+        'name': attr.name,
+        **level_progress(attr.current_xp),
+        'subskills': [serialize_subskill(subskill) for subskill in attr.subskills]
+    }
+
+def serialize_task(task):
+    return {
+        'id': task.task_id,
+        'description': task.description,
+        'type': task.task_type,
+        'completed': task.is_completed,
+        'skipped': task.is_skipped,
+        'attribute': task.attribute.name if task.attribute else None,
+        'subskill': task.subskill.name if task.subskill else None,
+        'xp': task.xp_gained,
+        'stress_effect': task.stress_effect,
+        'is_negative_habit': task.is_negative_habit,
+        'numeric_value': task.numeric_value,
+        'numeric_unit': task.numeric_unit,
+        'logged_numeric_value': task.logged_numeric_value
+    }
+
+def serialize_recurring_task(rt):
+    return {
+        'recurring_task_id': rt.recurring_task_id,
+        'description': rt.description,
+        'attribute_name': rt.attribute.name if rt.attribute else None,
+        'subskill_name': rt.subskill.name if rt.subskill else None,
+        'xp_value': rt.xp_value,
+        'stress_effect': rt.stress_effect,
+        'is_negative_habit': rt.is_negative_habit,
+        'is_active': rt.is_active,
+        'last_added_date': rt.last_added_date,
+        'numeric_value': rt.numeric_value,
+        'numeric_unit': rt.numeric_unit
+    }
+
+def quest_step_totals(*criteria):
+    """Step count and completed steps per quest, over the quests matching criteria"""
+    return db.select(
+        QuestStep.quest_id,
+        func.count(QuestStep.id).label('step_count'),
+        count_where(QuestStep.is_completed == True).label('steps_completed')
+    ).join(Quest, Quest.quest_id == QuestStep.quest_id).where(*criteria).group_by(QuestStep.quest_id).subquery()
+
+def serialize_quest(quest, step_totals=None):
+    """step_totals is (step_count, steps_completed) when the caller aggregated them in SQL"""
+    if step_totals is None:
+        step_totals = (len(quest.steps), sum(1 for step in quest.steps if step.is_completed))
+    step_count, steps_completed = step_totals
+    return {
+        'id': quest.quest_id,
+        'title': quest.title,
+        'description': quest.description,
+        'difficulty': quest.difficulty,
+        'xp_reward': quest.xp_reward,
+        'attribute_focus': quest.attribute_focus,
+        'start_date': quest.start_date,
+        'due_date': quest.due_date,
+        'completed_date': quest.completed_date,
+        'status': quest.status,
+        'steps': [{
+            'id': step.id,
+            'description': step.description,
+            'is_completed': step.is_completed
+        } for step in quest.steps],
+        'step_count': step_count,
+        'steps_completed': steps_completed,
+        'progress_percent': round(steps_completed / step_count * 100, 1) if step_count else 0
+    }
+
+def serialize_daily_stat(stat):
+    return {
+        'date': stat.date,
+        'count': stat.tasks_completed,
+        'xp': stat.total_xp_gained
+    }
+
+def serialize_milestone(milestone):
+    return {
+        'id': milestone.milestone_id,
+        'date': milestone.date,
+        'title': milestone.title,
+        'description': milestone.description,
+        'type': milestone.achievement_type,
+        'attribute': milestone.attribute.name if milestone.attribute else None
+    }
+
+# --- Request Metrics ---
+# Every request counts its SQL statements and their time (engine cursor
+# events) and reports them with the handler's wall time in a Server-Timing
+# header, which browser dev tools show next to each request. The same
+# numbers feed per-route histograms on /metrics in the Prometheus text
+# format, with OpenAI latency tracked separately. Histograms live in the
+# worker process and carry its pid, so each gunicorn worker reports its own
+# series; sum over pid when querying.
+REQUEST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+AI_SECONDS_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+# The scrape itself, static files and long-lived event streams would only skew the latency histograms
+METRICS_EXEMPT_ENDPOINTS = {'metrics', 'static', 'api_events'}
+
+def format_labels(labels):
+    escaped = {
+        name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        for name, value in labels.items()
+    }
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped.items()) + '}'
+
+class Histogram:
+    """Prometheus-style histogram with one series per label set, shared by request threads"""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        # Bucket bounds are inclusive ("le"), so a value equal to a bound lands in it
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += value
+
+    def render(self):
+        with self.lock:
+            series = {key: (list(data['counts']), data['sum']) for key, data in self.series.items()}
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in sorted(series.items()):
+            labels = {**dict(key), 'pid': os.getpid()}
+            cumulative = list(accumulate(counts))
+            for bound, count in zip((*self.buckets, '+Inf'), cumulative):
+                lines.append(f'{self.name}_bucket{format_labels({**labels, "le": bound})} {count}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {total:.6f}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {cumulative[-1]}')
+        return lines
+
+request_seconds = Histogram(
+    'liferpg_request_duration_seconds', 'Wall time from the first before_request hook to the response.',
+    REQUEST_SECONDS_BUCKETS
+)
+request_db_seconds = Histogram(
+    'liferpg_request_db_seconds', 'Time spent executing SQL statements per request.', REQUEST_SECONDS_BUCKETS
+)
+request_queries = Histogram(
+    'liferpg_request_queries', 'SQL statements executed per request.', QUERY_COUNT_BUCKETS
+)
+ai_request_seconds = Histogram(
+    'liferpg_ai_request_duration_seconds', 'OpenAI chat completion latency, including failed calls.',
+    AI_SECONDS_BUCKETS
+)
+METRICS = (request_seconds, request_db_seconds, request_queries, ai_request_seconds)
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    # AI job threads and CLI commands have no request to charge the query to
+    if has_request_context() and 'request_started' in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - conn.info['query_started']
+
+@app.before_request
+def start_request_metrics():
+    # Registered ahead of the other hooks so their queries (user load, ETag) count too
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={g.db_seconds * 1000:.1f};desc="{g.db_queries} queries", app;dur={elapsed * 1000:.1f}'
+    )
+    if request.endpoint not in METRICS_EXEMPT_ENDPOINTS:
+        # The URL rule, not the path, so /api/notes/1 and /api/notes/2 share a series
+        labels = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'status': response.status_code
+        }
+        request_seconds.observe(elapsed, **labels)
+        request_db_seconds.observe(g.db_seconds, **labels)
+        request_queries.observe(g.db_queries, **labels)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Request and AI latency histograms for this worker, in Prometheus text format.
+
+    Closed by default: the app listens on a single public port, and per-route
+    traffic and latency are nobody else's business.
+    """
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif not app.config['METRICS_PUBLIC']:
+        return Response('Not Found\n', status=404, mimetype='text/plain')
+    lines = [line for histogram in METRICS for line in histogram.render()]
+    return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- HTTP Caching ---
+# Every GET under /api/ carries a strong ETag derived from the user's data
+# version. Mutating /api/ requests bump that version inside their own
+# transaction, so a matching If-None-Match can be answered with 304 before
+# the endpoint runs a single query.
+ETAG_EXEMPT_ENDPOINTS = {'api_get_job', 'api_get_ai_cache_stats', 'api_get_user_cache_stats', 'api_events'}
+# POSTs that only call OpenAI; bumping would hold a write lock for the whole call
+NON_MUTATING_POST_ENDPOINTS = {'test_api_key', 'api_generate_quest', 'api_enhance_quest_description'}
+
+def bump_data_version(user_id):
+    """Invalidate the user's cached API responses within the caller's transaction"""
+    stmt = dialect_insert(UserDataVersion).values(user_id=user_id, version=1)
+    if hasattr(stmt, 'on_conflict_do_update'):
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id'], set_={'version': UserDataVersion.version + 1}
+        )
+    db.session.execute(stmt)
+
+def current_etag(user_id):
+    version = db.session.execute(
+        db.select(UserDataVersion.version).where(UserDataVersion.user_id == user_id)
+    ).scalar() or 0
+    # "Today" changes what several endpoints return, so it is part of the tag
+    fingerprint = f"{user_id}:{datetime.date.today().isoformat()}:{request.full_path}"
+    return f"{version}-{hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]}"
+
+@app.before_request
+def handle_data_version():
+    if not request.path.startswith('/api/') or not current_user.is_authenticated:
+        return None
+    
+    if request.method == 'GET' and request.endpoint not in ETAG_EXEMPT_ENDPOINTS:
+        g.etag = current_etag(current_user.id)
+        if request.if_none_match.contains(g.etag):
+            response = app.response_class(status=304)
+            response.set_etag(g.etag)
+            return response
+    elif request.method in ('POST', 'PUT', 'DELETE') and request.endpoint not in NON_MUTATING_POST_ENDPOINTS:
+        # Committed (or rolled back) together with the endpoint's own changes
+        bump_data_version(current_user.id)
+    return None
+
+@app.after_request
+def add_etag(response):
+    if g.get('etag') and response.status_code == 200:
+        response.set_etag(g.etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# --- Live Events ---
+# Mutating endpoints record compact deltas (a task, an attribute's XP, the
+# stats block...) in user_event, inside their own transaction, and echo them
+# in their JSON response. /api/events streams the same deltas to every other
+# open tab, so clients patch state in place instead of refetching collections.
+EVENT_POLL_SECONDS = 2
+EVENT_RETENTION = datetime.timedelta(minutes=10)
+# A refused stream tells the browser to come back after this long; it polls meanwhile
+EVENT_STREAM_RETRY_SECONDS = 60
+event_condition = threading.Condition()
+event_stream_slots = threading.BoundedSemaphore(app.config['EVENT_STREAMS_PER_WORKER'])
+
+def prune_events(user_id):
+    """Drop the user's deltas older than any stream could still resume from, once per request"""
+    pruned = g.setdefault('pruned_event_users', set())
+    if user_id in pruned:
+        return
+    pruned.add(user_id)
+    UserEvent.query.filter(
+        UserEvent.user_id == user_id,
+        UserEvent.created_at < datetime.datetime.utcnow() - EVENT_RETENTION
+    ).delete(synchronize_session=False)
+
+def emit_event(user_id, kind, **data):
+    """Record a state delta; it is published when the caller's transaction commits"""
+    payload = {'type': kind, **data}
+    # Pruned on write, so a user's log stays bounded whether or not they ever open a stream
+    prune_events(user_id)
+    db.session.add(UserEvent(user_id=user_id, payload=json.dumps(payload)))
+    g.setdefault('events', []).append(payload)
+    return payload
+
+def emit_task(task):
+    emit_event(task.user_id, 'task', date=task.date, task=serialize_task(task))
+
+def emit_attributes(*attributes):
+    for attribute in {attr.attribute_id: attr for attr in attributes if attr is not None}.values():
+        emit_event(attribute.user_id, 'attribute', attribute=serialize_attribute(attribute))
+
+def emit_stats(user_id):
+    emit_event(user_id, 'stats', stats=load_stats(user_id))
+
+def emitted_events():
+    return g.get('events', [])
+
+@app.after_request
+def notify_event_streams(response):
+    if g.get('events'):
+        with event_condition:
+            event_condition.notify_all()
+    return response
 
 # --- Authentication Routes ---
 @app.route('/register', methods=['GET', 'POST'])
@@ -339,10 +1576,11 @@ def register():
             password_hash=generate_password_hash(password)
         )
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
         
-        # Initialize user data
+        # Initialize user data in the same transaction
         initialize_user_data(user)
+        db.session.commit()
         
         # Log them in
         login_user(user)
@@ -389,6 +1627,35 @@ def logout():
 def index():
     return render_template('index.html', user=current_user)
 
+pool_warmed = False
+
+def warm_db_pool():
+    """Open pool_size connections at once so the first real requests don't pay for the handshakes"""
+    connections = []
+    try:
+        for _ in range(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('pool_size', 1)):
+            connection = db.engine.connect()
+            connections.append(connection)
+            connection.execute(text('SELECT 1'))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness plus database reachability; the first call in each worker fills its pool"""
+    global pool_warmed
+    try:
+        if pool_warmed:
+            db.session.execute(text('SELECT 1'))
+        else:
+            warm_db_pool()
+            pool_warmed = True
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 503
+    return jsonify({'status': 'ok', 'pool': db.engine.pool.status()})
+
 @app.route('/api/test_api_key', methods=['POST'])
 @login_required
 def test_api_key():
@@ -399,128 +1666,53 @@ def test_api_key():
     if not api_key:
         return jsonify({'success': False, 'error': 'No API key provided'})
     
+    started = time.perf_counter()
     try:
-        openai.api_key = api_key
+        # Per call, never the process-wide openai.api_key: threads serve different users
         response = openai.ChatCompletion.create(
+            api_key=api_key,
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": "test"}],
             max_tokens=5
         )
+        ai_request_seconds.observe(time.perf_counter() - started, call='test_key', outcome='ok')
+        ai_cache.mark_key_validated(api_key)
         return jsonify({'success': True})
     except Exception as e:
+        ai_request_seconds.observe(time.perf_counter() - started, call='test_key', outcome='error')
         error_message = str(e)
         print(f"API key test failed: {error_message}")
         return jsonify({'success': False, 'error': error_message})
 
 # --- API Routes ---
+def load_attributes(user_id):
+    attributes = Attribute.query.options(*ATTRIBUTE_LOADS).filter_by(
+        user_id=user_id
+    ).order_by(Attribute.name).all()
+    
+    return [serialize_attribute(attr) for attr in attributes]
+
 @app.route('/api/attributes')
 @login_required
 def api_get_attributes():
-    attributes = Attribute.query.filter_by(user_id=current_user.id).order_by(Attribute.name).all()
-    
-    attributes_data = []
-    for attr in attributes:
-        level = calculate_level_from_exp(attr.current_xp)
-        current_level_xp = calculate_exp_for_level(level)
-        next_level_xp = calculate_exp_for_level(level + 1)
-        xp_progress = attr.current_xp - current_level_xp
-        xp_needed = next_level_xp - current_level_xp
-        progress_percent = (xp_progress / xp_needed * 100) if xp_needed > 0 else 100
-        
-        # Get subskills
-        subskills_data = []
-        for subskill in attr.subskills:
-            sub_level = calculate_level_from_exp(subskill.current_xp)
-            sub_current_level_xp = calculate_exp_for_level(sub_level)
-            sub_next_level_xp = calculate_exp_for_level(sub_level + 1)
-            sub_xp_progress = subskill.current_xp - sub_current_level_xp
-            sub_xp_needed = sub_next_level_xp - sub_current_level_xp
-            sub_progress_percent = (sub_xp_progress / sub_xp_needed * 100) if sub_xp_needed > 0 else 100
-            
-            subskills_data.append({
-                'id': subskill.subskill_id,
-                'name': subskill.name,
-                'level': sub_level,
-                'total_xp': subskill.current_xp,
-                'xp_progress': sub_xp_progress,
-                'xp_needed': sub_xp_needed,
-                'progress_percent': sub_progress_percent
-            })
-        
-        attributes_data.append({
-            'id': attr.attribute_id,
-            'name': attr.name,
-            'level': level,
-            'total_xp': attr.current_xp,
-            'xp_progress': xp_progress,
-            'xp_needed': xp_needed,
-            'progress_percent': progress_percent,
-            'subskills': subskills_data
-        })
-    
-    return jsonify(attributes_data)
+    return jsonify(load_attributes(current_user.id))
 
-@app.route('/api/tasks')
-@login_required
-def api_get_tasks():
-    date = request.args.get('date', datetime.date.today().isoformat())
-    
+def load_tasks(user_id, date):
     # Process recurring tasks for this date
-    recurring_tasks = RecurringTask.query.filter_by(
-        user_id=current_user.id, 
-        is_active=True
-    ).filter(RecurringTask.start_date <= date).all()
-    
-    for rt in recurring_tasks:
-        # Check if already added for this date
-        existing_task = Task.query.filter_by(
-            user_id=current_user.id,
-            date=date,
-            description=rt.description
-        ).first()
-        
-        if not existing_task:
-            task = Task(
-                user_id=current_user.id,
-                date=date,
-                description=rt.description,
-                task_type='recurring',
-                attribute_id=rt.attribute_id,
-                subskill_id=rt.subskill_id,
-                xp_gained=rt.xp_value,
-                stress_effect=rt.stress_effect,
-                is_negative_habit=rt.is_negative_habit,
-                numeric_value=rt.numeric_value,
-                numeric_unit=rt.numeric_unit
-            )
-            db.session.add(task)
-    
-    db.session.commit()
+    materialize_recurring_tasks(user_id, date)
     
     # Get tasks for the date, sorted alphabetically
-    tasks = Task.query.filter_by(user_id=current_user.id, date=date).order_by(
+    tasks = Task.query.options(*TASK_LOADS).filter_by(user_id=user_id, date=date).order_by(
         Task.is_completed, Task.is_skipped, Task.description.asc()
     ).all()
     
-    tasks_data = []
-    for task in tasks:
-        tasks_data.append({
-            'id': task.task_id,
-            'description': task.description,
-            'type': task.task_type,
-            'completed': task.is_completed,
-            'skipped': task.is_skipped,
-            'attribute': task.attribute.name if task.attribute else None,
-            'subskill': task.subskill.name if task.subskill else None,
-            'xp': task.xp_gained,
-            'stress_effect': task.stress_effect,
-            'is_negative_habit': task.is_negative_habit,
-            'numeric_value': task.numeric_value,
-            'numeric_unit': task.numeric_unit,
-            'logged_numeric_value': task.logged_numeric_value
-        })
-    
-    return jsonify(tasks_data)
+    return [serialize_task(task) for task in tasks]
+
+@app.route('/api/tasks')
+@login_required
+def api_get_tasks():
+    date = request.args.get('date', datetime.date.today().isoformat())
+    return jsonify(load_tasks(current_user.id, date))
 
 @app.route('/api/add_task', methods=['POST'])
 @login_required
@@ -567,24 +1759,75 @@ def api_add_task():
     )
     
     db.session.add(task)
+    db.session.flush()
+    emit_task(task)
+    emit_stats(current_user.id)
     db.session.commit()
     
-    return jsonify({'success': True, 'task_id': task.task_id})
-
-@app.route('/api/complete_task', methods=['POST'])
-@login_required
-def api_complete_task():
-    data = request.json
-    task_id = data.get('task_id')
-    logged_numeric_value = data.get('logged_numeric_value')
+    return jsonify({'success': True, 'task_id': task.task_id, 'events': emitted_events()})
+
+# --- Task Mutations ---
+# The single-action endpoints and /api/batch share these. `rows` accumulates
+# what the completions change (XP per attribute/subskill, the stress floor
+# arithmetic, counter and DailyStat deltas, attributes to publish) and
+# finish_task_mutations writes each of them once, as SQL-side increments, so
+# concurrent requests add to each other instead of overwriting.
+def new_mutation_rows():
+    return {'xp': {}, 'xp_events': [], 'stress': None, 'daily': {}, 'attributes': {}, 'counters': {}}
+
+def award_task_xp(task, rows):
+    reward_xp = task.xp_gained or 25
+    for target in (task.attribute, task.subskill):
+        if target:
+            rows['xp_events'].append(xp_event_row(task.user_id, target, reward_xp, 'task', task.task_id, task.date))
+            rows['xp'][target] = rows['xp'].get(target, 0) + reward_xp
+    if task.attribute:
+        rows['attributes'][task.attribute.attribute_id] = task.attribute
+    if task.subskill:
+        rows['attributes'][task.subskill.attribute_id] = task.subskill.attribute
+    count, xp = rows['daily'].get(task.date, (0, 0))
+    rows['daily'][task.date] = (count + 1, xp + reward_xp)
+
+def adjust_stress(user_id, delta, rows):
+    # Applying x -> max(0, x + d) in turn composes to x -> max(x + offset, floor),
+    # so any sequence of adjustments is a single UPDATE
+    offset, floor = rows['stress'] or (0, 0)
+    rows['stress'] = (offset + delta, max(floor + delta, 0))
+
+def update_stress(user_id, offset, floor):
+    value = CharacterStat.value + offset
+    CharacterStat.query.filter_by(user_id=user_id, stat_name='Stress').update(
+        {'value': db.case((value < floor, floor), else_=value)}, synchronize_session=False
+    )
 
-    task = Task.query.filter_by(task_id=task_id, user_id=current_user.id).first()
+def record_completion(task, rows):
+    """Queue the counter deltas, task event and rollup date for a completion"""
+    for name, delta in completion_deltas(task).items():
+        rows['counters'][name] = rows['counters'].get(name, 0) + delta
+    emit_task(task)
+
+def claim_task(task, guards, **changes):
+    """Set the task's flags unless one of the guard columns is already true.
+
+    The check is in the UPDATE's WHERE clause, so when two requests race to
+    complete (or skip) the same task only one of them matches the row; the
+    other gets False and must award nothing.
+    """
+    claimed = Task.query.filter(
+        Task.task_id == task.task_id, *(column.isnot(True) for column in guards)
+    ).update(changes, synchronize_session=False)
+    if not claimed:
+        return False
+    for name, value in changes.items():
+        set_committed_value(task, name, value)
+    return True
+
+def apply_complete_task(task, logged_numeric_value, rows):
     if not task:
-        return jsonify({'success': False, 'error': 'Task not found'})
-    if task.is_completed:
-        return jsonify({'success': False, 'error': 'Task already completed'})
+        return {'success': False, 'error': 'Task not found'}
+    if task.is_completed or not claim_task(task, (Task.is_completed,), is_completed=True):
+        return {'success': False, 'error': 'Task already completed'}
 
-    task.is_completed = True
     if logged_numeric_value is not None:
         try:
             task.logged_numeric_value = float(logged_numeric_value)
@@ -606,119 +1849,100 @@ def api_complete_task():
             is_success = True
 
     if is_success:
-        reward_xp = task.xp_gained or 25
-        
-        if task.attribute:
-            task.attribute.current_xp += reward_xp
-        if task.subskill:
-            task.subskill.current_xp += reward_xp
-        
+        award_task_xp(task, rows)
         if task.is_negative_habit:
-            stress_stat = CharacterStat.query.filter_by(user_id=current_user.id, stat_name='Stress').first()
-            if stress_stat:
-                stress_stat.value = max(0, stress_stat.value - 5)
-    else:
-        if task.is_negative_habit:
-            stress_stat = CharacterStat.query.filter_by(user_id=current_user.id, stat_name='Stress').first()
-            if stress_stat and task.stress_effect != 0:
-                stress_stat.value = max(0, stress_stat.value + abs(task.stress_effect))
-
-    today = datetime.date.today().isoformat()
-    daily_stat = DailyStat.query.filter_by(user_id=current_user.id, date=today).first()
-    if not daily_stat:
-        daily_stat = DailyStat(user_id=current_user.id, date=today, tasks_completed=0, total_xp_gained=0)
-        db.session.add(daily_stat)
-
-    if daily_stat.tasks_completed is None: daily_stat.tasks_completed = 0
-    if daily_stat.total_xp_gained is None: daily_stat.total_xp_gained = 0
-
-    if is_success:
-        daily_stat.tasks_completed += 1
-        daily_stat.total_xp_gained += (task.xp_gained or 25)
+            adjust_stress(task.user_id, -5, rows)
+    elif task.is_negative_habit and task.stress_effect != 0:
+        adjust_stress(task.user_id, abs(task.stress_effect), rows)
 
-    db.session.commit()
-    return jsonify({'success': True, 'was_success': is_success})
+    record_completion(task, rows)
+    return {'success': True, 'was_success': is_success}
 
-@app.route('/api/complete_negative_habit', methods=['POST'])
-@login_required
-def api_complete_negative_habit():
-    data = request.json
-    task_id = data.get('task_id')
-    did_negative = data.get('did_negative')
-    
-    task = Task.query.filter_by(task_id=task_id, user_id=current_user.id).first()
+def apply_complete_negative_habit(task, did_negative, rows):
     if not task or not task.is_negative_habit:
-        return jsonify({'success': False, 'error': 'Invalid task'})
-    
-    if task.is_completed:
-        return jsonify({'success': False, 'error': 'Task already completed'})
+        return {'success': False, 'error': 'Invalid task'}
+    if task.is_completed or not claim_task(task, (Task.is_completed,), is_completed=True):
+        return {'success': False, 'error': 'Task already completed'}
     
-    task.is_completed = True
     task.negative_habit_done = did_negative
     
     if did_negative:
         if task.stress_effect != 0:
-            stress_stat = CharacterStat.query.filter_by(
-                user_id=current_user.id, 
-                stat_name='Stress'
-            ).first()
-            if stress_stat:
-                stress_stat.value = max(0, stress_stat.value + abs(task.stress_effect))
+            adjust_stress(task.user_id, abs(task.stress_effect), rows)
     else:
-        reward_xp = task.xp_gained or 25
-        if task.attribute:
-            task.attribute.current_xp += reward_xp
-        if task.subskill:
-            task.subskill.current_xp += reward_xp
-        
-        stress_stat = CharacterStat.query.filter_by(
-            user_id=current_user.id, 
-            stat_name='Stress'
-        ).first()
-        if stress_stat:
-            stress_stat.value = max(0, stress_stat.value - 5)
-    
-    today = datetime.date.today().isoformat()
-    daily_stat = DailyStat.query.filter_by(user_id=current_user.id, date=today).first()
-    if not daily_stat:
-        daily_stat = DailyStat(
-            user_id=current_user.id, 
-            date=today,
-            stress_level=0,
-            tasks_completed=0,
-            total_xp_gained=0
-        )
-        db.session.add(daily_stat)
-    
-    if daily_stat.tasks_completed is None:
-        daily_stat.tasks_completed = 0
-    if daily_stat.total_xp_gained is None:
-        daily_stat.total_xp_gained = 0
+        award_task_xp(task, rows)
+        adjust_stress(task.user_id, -5, rows)
     
-    daily_stat.tasks_completed += 1
-    if not did_negative:
-        daily_stat.total_xp_gained += (task.xp_gained or 25)
+    record_completion(task, rows)
+    return {'success': True, 'did_negative': did_negative}
+
+def apply_skip_task(task, rows):
+    if not task:
+        return {'success': False, 'error': 'Task not found'}
+    if task.is_completed or task.is_skipped or not claim_task(
+        task, (Task.is_completed, Task.is_skipped), is_skipped=True
+    ):
+        return {'success': False, 'error': 'Task already completed or skipped'}
+    
+    emit_task(task)
+    return {'success': True}
+
+def finish_task_mutations(user_id, rows):
+    """Write the accumulated counters and rollups and publish the shared deltas once"""
+    bump_counters(user_id, **rows['counters'])
+    for target, delta in rows['xp'].items():
+        increment_xp(target, delta)
+    append_xp_events(rows['xp_events'])
+    if rows['stress']:
+        update_stress(user_id, *rows['stress'])
+    emit_attributes(*rows['attributes'].values())
+    emit_daily_stats(user_id, add_daily_stats(user_id, rows['daily']))
+    emit_stats(user_id)
+
+@app.route('/api/complete_task', methods=['POST'])
+@login_required
+def api_complete_task():
+    data = request.json
+    task = Task.query.options(*TASK_LOADS).filter_by(task_id=data.get('task_id'), user_id=current_user.id).first()
+    rows = new_mutation_rows()
+    result = apply_complete_task(task, data.get('logged_numeric_value'), rows)
+    if not result['success']:
+        return jsonify(result)
     
+    finish_task_mutations(current_user.id, rows)
     db.session.commit()
-    return jsonify({'success': True, 'did_negative': did_negative})
+    return jsonify({**result, 'events': emitted_events()})
+
+@app.route('/api/complete_negative_habit', methods=['POST'])
+@login_required
+def api_complete_negative_habit():
+    data = request.json
+    # Stored as negative_habit_done, where NULL would count as neither done nor avoided
+    if not isinstance(data.get('did_negative'), bool):
+        return jsonify({'success': False, 'error': 'did_negative must be true or false'}), 400
+    task = Task.query.options(*TASK_LOADS).filter_by(task_id=data.get('task_id'), user_id=current_user.id).first()
+    rows = new_mutation_rows()
+    result = apply_complete_negative_habit(task, data.get('did_negative'), rows)
+    if not result['success']:
+        return jsonify(result)
+    
+    finish_task_mutations(current_user.id, rows)
+    db.session.commit()
+    return jsonify({**result, 'events': emitted_events()})
 
 @app.route('/api/skip_task', methods=['POST'])
 @login_required
 def api_skip_task():
     data = request.json
-    task_id = data.get('task_id')
+    task = Task.query.options(*TASK_LOADS).filter_by(task_id=data.get('task_id'), user_id=current_user.id).first()
+    rows = new_mutation_rows()
+    result = apply_skip_task(task, rows)
+    if not result['success']:
+        return jsonify(result)
     
-    task = Task.query.filter_by(task_id=task_id, user_id=current_user.id).first()
-    if not task:
-        return jsonify({'success': False, 'error': 'Task not found'})
-    
-    if task.is_completed or task.is_skipped:
-        return jsonify({'success': False, 'error': 'Task already completed or skipped'})
-    
-    task.is_skipped = True
+    finish_task_mutations(current_user.id, rows)
     db.session.commit()
-    
-    return jsonify({'success': True})
+    return jsonify({**result, 'events': emitted_events()})
 
 @app.route('/api/delete_task', methods=['POST'])
 @login_required
@@ -732,101 +1956,109 @@ def api_delete_task():
     
     if task.is_completed and not task.is_negative_habit and task.xp_gained > 0:
         if task.attribute:
-            task.attribute.current_xp = max(0, task.attribute.current_xp - task.xp_gained)
+            add_xp(current_user.id, task.attribute, -task.xp_gained, 'task_deleted', task.task_id, task.date)
         if task.subskill:
-            task.subskill.current_xp = max(0, task.subskill.current_xp - task.xp_gained)
+            add_xp(current_user.id, task.subskill, -task.xp_gained, 'task_deleted', task.task_id, task.date)
     
+    # Let the template re-materialize this day, as it did before watermarks existed
+    if task.recurring_task_id:
+        RecurringTask.query.filter_by(
+            recurring_task_id=task.recurring_task_id,
+            last_added_date=task.date
+        ).update({'last_added_date': None}, synchronize_session=False)
+    
+    bump_counters(current_user.id, **completion_deltas(task, sign=-1))
     db.session.delete(task)
+    emit_event(current_user.id, 'task_deleted', date=task.date, task_id=task.task_id)
+    if task.is_completed:
+        emit_daily_stats(current_user.id, rollup_daily_stats(current_user.id, [task.date]))
+    emit_attributes(task.attribute, task.subskill.attribute if task.subskill else None)
+    emit_stats(current_user.id)
     db.session.commit()
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'events': emitted_events()})
+
+def load_stats(user_id):
+    today = datetime.date.today().isoformat()
+    
+    # Today's counts, XP and stress are bounded index lookups; they ride along
+    # as scalar subqueries so the whole endpoint is a single statement
+    today_tasks = (Task.user_id == user_id, Task.date == today)
+    live_columns = (
+        db.select(CharacterStat.value).where(
+            CharacterStat.user_id == user_id, CharacterStat.stat_name == 'Stress'
+        ).scalar_subquery().label('stress'),
+        db.select(func.count(Task.task_id)).where(
+            *today_tasks, Task.is_skipped == True
+        ).scalar_subquery().label('skipped_today'),
+        db.select(func.count(Task.task_id)).where(
+            *today_tasks, Task.is_completed == False, Task.is_skipped == False
+        ).scalar_subquery().label('remaining_today'),
+        db.select(func.coalesce(func.sum(Attribute.current_xp), 0)).where(
+            Attribute.user_id == user_id
+        ).scalar_subquery().label('total_xp')
+    )
+    
+    if app.config['STATS_COUNTERS']:
+        counters_query = db.select(
+            UserCounter.tasks_completed, UserCounter.negative_habits_done, UserCounter.negative_habits_avoided,
+            UserCounter.active_quests, UserCounter.completed_quests, *live_columns
+        ).where(UserCounter.user_id == user_id)
+        row = db.session.execute(counters_query).mappings().first()
+        if row is None:
+            # Every user has a row since migration 7; should one go missing it is
+            # rebuilt within the caller's transaction, never committed from here
+            rebuild_user_counters(user_id)
+            row = db.session.execute(counters_query).mappings().one()
+    else:
+        totals = counter_totals(user_id).subquery()
+        row = db.session.execute(db.select(totals, *live_columns)).mappings().one()
+    
+    stats = {}
+    if row['stress'] is not None:
+        stats['Stress'] = row['stress']
+    stats['Total Tasks Completed'] = row['tasks_completed']
+    stats['Negative Habits Done'] = row['negative_habits_done']
+    stats['Negative Habits Avoided'] = row['negative_habits_avoided']
+    stats['Tasks Skipped Today'] = row['skipped_today']
+    stats['Tasks Remaining Today'] = row['remaining_today']
+    stats['Total XP'] = row['total_xp']
+    stats['Active Quests'] = row['active_quests']
+    stats['Completed Quests'] = row['completed_quests']
+    
+    return stats
 
 @app.route('/api/stats')
 @login_required
 def api_get_stats():
-    stats = {}
-    
-    character_stats = CharacterStat.query.filter_by(user_id=current_user.id).all()
-    for stat in character_stats:
-        stats[stat.stat_name] = stat.value
-    
-    stats['Total Tasks Completed'] = Task.query.filter_by(
-        user_id=current_user.id, 
-        is_completed=True
-    ).count()
-    
-    stats['Negative Habits Done'] = Task.query.filter_by(
-        user_id=current_user.id, 
-        is_completed=True, 
-        is_negative_habit=True,
-        negative_habit_done=True
-    ).count()
-    
-    stats['Negative Habits Avoided'] = Task.query.filter_by(
-        user_id=current_user.id, 
-        is_completed=True, 
-        is_negative_habit=True,
-        negative_habit_done=False
-    ).count()
+    return jsonify(load_stats(current_user.id))
+
+def load_milestones(user_id, cursor=None, limit=5, with_total=False):
+    milestones, next_cursor = keyset_page(
+        db.select(Milestone).options(*MILESTONE_LOADS).where(Milestone.user_id == user_id),
+        Milestone.date, Milestone.milestone_id, cursor, limit
+    )
     
-    today = datetime.date.today().isoformat()
-    stats['Tasks Skipped Today'] = Task.query.filter_by(
-        user_id=current_user.id, 
-        date=today, 
-        is_skipped=True
-    ).count()
-    
-    stats['Tasks Remaining Today'] = Task.query.filter_by(
-        user_id=current_user.id, 
-        date=today, 
-        is_completed=False, 
-        is_skipped=False
-    ).count()
-    
-    total_xp = db.session.query(db.func.sum(Attribute.current_xp)).filter_by(user_id=current_user.id).scalar()
-    stats['Total XP'] = total_xp or 0
-    
-    stats['Active Quests'] = Quest.query.filter_by(
-        user_id=current_user.id, 
-        status='Active'
-    ).count()
-    
-    stats['Completed Quests'] = Quest.query.filter_by(
-        user_id=current_user.id, 
-        status='Completed'
-    ).count()
-    
-    return jsonify(stats)
+    page = {
+        'milestones': [serialize_milestone(milestone) for milestone in milestones],
+        'next_cursor': next_cursor
+    }
+    if with_total:
+        page['total'] = Milestone.query.filter_by(user_id=user_id).count()
+    return page
 
 @app.route('/api/milestones')
 @login_required
 def api_get_milestones():
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 5, type=int)
-    
-    total = Milestone.query.filter_by(user_id=current_user.id).count()
-    
-    milestones = Milestone.query.filter_by(user_id=current_user.id).order_by(
-        Milestone.date.desc(), Milestone.milestone_id.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
-    
-    milestones_data = []
-    for milestone in milestones.items:
-        milestones_data.append({
-            'id': milestone.milestone_id,
-            'date': milestone.date,
-            'title': milestone.title,
-            'description': milestone.description,
-            'type': milestone.achievement_type,
-            'attribute': milestone.attribute.name if milestone.attribute else None
-        })
-    
-    return jsonify({
-        'milestones': milestones_data,
-        'current_page': page,
-        'pages': milestones.pages,
-        'total': total
-    })
+    try:
+        return jsonify(load_milestones(
+            current_user.id,
+            request.args.get('cursor'),
+            request.args.get('limit', 5, type=int),
+            request.args.get('total', '').lower() in ('1', 'true')
+        ))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
 
 @app.route('/api/delete_milestone', methods=['POST'])
 @login_required
@@ -846,22 +2078,24 @@ def api_delete_milestone():
     
     return jsonify({'success': False, 'error': 'Milestone not found'})
 
-@app.route('/api/narrative')
-@login_required
-def api_get_narrative():
-    date = request.args.get('date', datetime.date.today().isoformat())
-    
+def load_narrative(user_id, date):
     narrative = DailyNarrative.query.filter_by(
-        user_id=current_user.id, 
+        user_id=user_id, 
         date=date
     ).first()
     
     narrative_text = narrative.narrative if narrative else "No adventure recorded for this day yet..."
     
-    return jsonify({
+    return {
         'date': date,
         'narrative': narrative_text
-    })
+    }
+
+@app.route('/api/narrative')
+@login_required
+def api_get_narrative():
+    date = request.args.get('date', datetime.date.today().isoformat())
+    return jsonify(load_narrative(current_user.id, date))
 
 @app.route('/api/generate_narrative', methods=['POST'])
 @login_required
@@ -873,13 +2107,29 @@ def api_generate_narrative():
     if not api_key:
         return jsonify({'error': 'API key required'}), 400
     
-    progress = NarrativeProgress.query.filter_by(user_id=current_user.id).first()
+    # The OpenAI call takes seconds; run it on the AI worker pool and let the
+    # client poll /api/jobs/<job_id> instead of holding this web worker
+    job = submit_job('narrative', current_user.id, date, generate_narrative, current_user.id, date, api_key)
+    if job is None:
+        return jsonify({'error': 'The storyteller is busy. Please try again in a moment.'}), 503
+    
+    return jsonify(serialize_job(job)), 202
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_get_job(job_id):
+    job = BackgroundJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(serialize_job(expire_stale_job(job)))
+
+def generate_narrative(user_id, date, api_key):
+    """Write the day's narrative entry and advance the story state"""
+    progress = NarrativeProgress.query.filter_by(user_id=user_id).first()
     if not progress:
-        progress = NarrativeProgress(user_id=current_user.id)
+        progress = NarrativeProgress(user_id=user_id)
         db.session.add(progress)
         db.session.flush()
     
-    last_narrative = DailyNarrative.query.filter_by(user_id=current_user.id).order_by(
+    last_narrative = DailyNarrative.query.filter_by(user_id=user_id).order_by(
         DailyNarrative.date.desc()
     ).first()
     
@@ -961,7 +2211,7 @@ At the end, update the story state in this format:
     progress.updated_at = datetime.datetime.utcnow()
     
     existing_narrative = DailyNarrative.query.filter_by(
-        user_id=current_user.id, 
+        user_id=user_id, 
         date=date
     ).first()
     
@@ -969,7 +2219,7 @@ At the end, update the story state in this format:
         existing_narrative.narrative = final_narrative
     else:
         new_narrative = DailyNarrative(
-            user_id=current_user.id,
+            user_id=user_id,
             date=date,
             narrative=final_narrative
         )
@@ -977,8 +2227,8 @@ At the end, update the story state in this format:
     
     db.session.commit()
     
-    return jsonify({
-        'narrative': final_narrative, 
+    return {
+        'narrative': final_narrative,
         'date': date,
         'story_day': progress.story_day - 1,
         'location': progress.current_location,
@@ -986,7 +2236,7 @@ At the end, update the story state in this format:
         'chapter': story_info['chapter'],
         'phase': story_info['phase'],
         'complexity': story_info['complexity']
-    })
+    }
 
 def get_story_phase_and_focus(story_day):
     chapter = (story_day - 1) // 50 + 1
@@ -1053,68 +2303,92 @@ def get_special_chapter_instructions(day_in_chapter, chapter_num):
     else:
         return "Continue the natural story progression."
 
-@app.route('/api/narratives')
-@login_required
-def api_get_narratives():
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 3, type=int)
-    
-    total = DailyNarrative.query.filter_by(user_id=current_user.id).count()
-    
-    narratives = DailyNarrative.query.filter_by(user_id=current_user.id).order_by(
-        DailyNarrative.date.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+def load_narratives(user_id, cursor=None, limit=3, with_total=False):
+    narratives, next_cursor = keyset_page(
+        db.select(DailyNarrative).where(DailyNarrative.user_id == user_id),
+        DailyNarrative.date, DailyNarrative.id, cursor, limit
+    )
     
     narratives_data = []
-    for narrative in narratives.items:
+    for narrative in narratives:
         narratives_data.append({
             'date': narrative.date,
             'narrative': narrative.narrative
         })
     
-    return jsonify({
+    page = {
         'narratives': narratives_data,
-        'current_page': page,
-        'pages': narratives.pages,
-        'total': total
-    })
+        'next_cursor': next_cursor
+    }
+    if with_total:
+        page['total'] = DailyNarrative.query.filter_by(user_id=user_id).count()
+    return page
 
-@app.route('/api/heatmap')
+@app.route('/api/narratives')
 @login_required
-def api_get_heatmap():
-    year = request.args.get('year', datetime.date.today().year, type=int)
-    month = request.args.get('month', datetime.date.today().month, type=int)
+def api_get_narratives():
+    try:
+        return jsonify(load_narratives(
+            current_user.id,
+            request.args.get('cursor'),
+            request.args.get('limit', 3, type=int),
+            request.args.get('total', '').lower() in ('1', 'true')
+        ))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+
+HEATMAP_MAX_DAYS = 366
+
+def load_heatmap_range(user_id, start_date, end_date):
+    """Daily rollups for start_date <= date < end_date, one range read on (user_id, date)"""
+    daily_stats = db.session.execute(
+        db.select(DailyStat.date, DailyStat.tasks_completed, DailyStat.total_xp_gained).where(
+            DailyStat.user_id == user_id,
+            DailyStat.date >= start_date,
+            DailyStat.date < end_date
+        ).order_by(DailyStat.date)
+    ).all()
     
+    return [serialize_daily_stat(stat) for stat in daily_stats]
+
+def load_heatmap(user_id, year, month):
     start_date = f"{year}-{month:02d}-01"
     if month == 12:
         end_date = f"{year + 1}-01-01"
     else:
         end_date = f"{year}-{month + 1:02d}-01"
     
-    daily_stats = DailyStat.query.filter_by(user_id=current_user.id).filter(
-        DailyStat.date >= start_date,
-        DailyStat.date < end_date
-    ).all()
-    
-    data = []
-    for stat in daily_stats:
-        data.append({
-            'date': stat.date,
-            'count': stat.tasks_completed,
-            'xp': stat.total_xp_gained
-        })
+    return load_heatmap_range(user_id, start_date, end_date)
+
+@app.route('/api/heatmap')
+@login_required
+def api_get_heatmap():
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive) serves a whole range, e.g. a year view
+    if 'from' in request.args:
+        try:
+            start = datetime.date.fromisoformat(request.args['from'])
+            end = datetime.date.fromisoformat(request.args.get('to', datetime.date.today().isoformat()))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'from and to must be YYYY-MM-DD dates'}), 400
+        if end < start or (end - start).days >= HEATMAP_MAX_DAYS:
+            return jsonify({'success': False, 'error': f'Range must span 1-{HEATMAP_MAX_DAYS} days'}), 400
+        return jsonify(load_heatmap_range(current_user.id, start.isoformat(), (end + timedelta(days=1)).isoformat()))
     
-    return jsonify(data)
+    year = request.args.get('year', datetime.date.today().year, type=int)
+    month = request.args.get('month', datetime.date.today().month, type=int)
+    return jsonify(load_heatmap(current_user.id, year, month))
 
 @app.route('/api/attribute_history')
 @login_required
 def api_get_attribute_history():
-    days = request.args.get('days', 30, type=int)
+    days = max(request.args.get('days', 30, type=int), 0)
     
     end_date = datetime.date.today()
     start_date = end_date - datetime.timedelta(days=days)
     
-    user_attributes = Attribute.query.filter_by(user_id=current_user.id).all()
+    user_attributes = db.session.execute(
+        db.select(Attribute.attribute_id, Attribute.name).where(Attribute.user_id == current_user.id)
+    ).all()
     
     dates = []
     current_date = start_date
@@ -1127,162 +2401,233 @@ def api_get_attribute_history():
         'attributes': {}
     }
     
+    # Each curve starts from the XP held the day before the window, then
+    # adds the window's ledger deltas day by day
+    baseline_xp = xp_as_of(current_user.id, (start_date - timedelta(days=1)).isoformat())['attributes']
+    xp_rows = db.session.execute(
+        db.select(XpEvent.attribute_id, XpEvent.date, func.sum(XpEvent.delta)).where(
+            XpEvent.user_id == current_user.id,
+            XpEvent.subskill_id.is_(None),
+            XpEvent.date >= dates[0],
+            XpEvent.date <= dates[-1]
+        ).group_by(XpEvent.attribute_id, XpEvent.date)
+    ).all()
+    
+    date_index = {date_str: i for i, date_str in enumerate(dates)}
+    daily_xp = {}
+    for attribute_id, day, xp in xp_rows:
+        daily_xp.setdefault(attribute_id, [0] * len(dates))[date_index[day]] = xp or 0
+    
     for attribute in user_attributes:
-        levels = []
-        running_xp = 0
-        
-        for date_str in dates:
-            daily_xp = db.session.query(db.func.sum(Task.xp_gained)).filter_by(
-                user_id=current_user.id,
-                attribute_id=attribute.attribute_id,
-                date=date_str,
-                is_completed=True,
-                is_negative_habit=False
-            ).scalar() or 0
-            
-            running_xp += daily_xp
-            levels.append(calculate_level_from_exp(running_xp))
+        deltas = daily_xp.get(attribute.attribute_id, [0] * len(dates))
+        running_xp = accumulate(deltas, initial=baseline_xp.get(attribute.attribute_id, 0))
+        next(running_xp)  # drop the baseline itself; the curve starts at the first day
+        levels = [calculate_level_from_exp(xp) for xp in running_xp]
         
         result['attributes'][attribute.name] = levels
     
+    # Keep any checkpoint xp_as_of stored along the way
+    db.session.commit()
     return jsonify(result)
 
 # --- NEW PROGRESS TRACKING ENDPOINTS ---
-@app.route('/api/get_numeric_habits')
-@login_required
-def get_numeric_habits():
+def load_numeric_habits(user_id):
     """Returns a list of unique descriptions for numeric habits."""
     habits = db.session.query(Task.description).filter(
-        Task.user_id == current_user.id,
+        Task.user_id == user_id,
         Task.numeric_unit.isnot(None)
     ).distinct().order_by(Task.description).all()
     
-    habit_list = [h[0] for h in habits]
-    return jsonify(habit_list)
+    return [h[0] for h in habits]
+
+@app.route('/api/get_numeric_habits')
+@login_required
+def get_numeric_habits():
+    return jsonify(load_numeric_habits(current_user.id))
+
+HABIT_BUCKETS = ('day', 'week', 'month')
+HABIT_MAX_DAYS = 3 * 366
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def calc_change(current, previous, is_negative_habit):
+    if previous > 0:
+        if is_negative_habit:
+            return round(((previous - current) / previous) * 100, 1)
+        else:
+            return round(((current - previous) / previous) * 100, 1)
+    elif current > 0:
+        return 100 if not is_negative_habit else -100
+    return 0
+
+def habit_daily_totals(user_id, description, start, end):
+    """[(date, total, entries)] of logged values per day: the one GROUP BY every bucketing reads"""
+    rows = db.session.execute(
+        db.select(Task.date, func.sum(Task.logged_numeric_value), func.count(Task.task_id)).where(
+            Task.user_id == user_id,
+            Task.description == description,
+            Task.is_completed == True,
+            Task.logged_numeric_value.isnot(None),
+            Task.date >= start.isoformat(),
+            Task.date <= end.isoformat()
+        ).group_by(Task.date)
+    ).all()
+    return [(date.fromisoformat(day), total or 0, entries) for day, total, entries in rows]
+
+def habit_buckets(daily, bucket, start, end, is_negative, window=3):
+    """Fold daily totals into day/week/month buckets covering start..end.
+
+    Every bucket in the range is present (empty ones are zero) and carries
+    a rolling average of the last `window` totals plus the change from the
+    previous bucket.
+    """
+    sums = {}
+    for day, total, entries in daily:
+        if start <= day <= end:
+            key = bucket_start(day, bucket)
+            previous_total, previous_entries = sums.get(key, (0, 0))
+            sums[key] = (previous_total + total, previous_entries + entries)
+    
+    buckets = []
+    cursor = bucket_start(start, bucket)
+    while cursor <= end:
+        total, entries = sums.get(cursor, (0, 0))
+        buckets.append({
+            'start': cursor.isoformat(),
+            'total': total,
+            'avg': total / entries if entries else 0,
+            'entries': entries
+        })
+        cursor = next_bucket(cursor, bucket)
+    
+    for index, current in enumerate(buckets):
+        recent = buckets[max(0, index - window + 1):index + 1]
+        current['rolling_avg'] = round(sum(b['total'] for b in recent) / len(recent), 2)
+        previous = buckets[index - 1] if index else None
+        current['total_change'] = calc_change(current['total'], previous['total'], is_negative) if previous else 0
+        current['avg_change'] = calc_change(current['avg'], previous['avg'], is_negative) if previous else 0
+    return buckets
 
 @app.route('/api/habit_progress')
 @login_required
 def get_habit_progress():
+    """Progress for one numeric habit.
+
+    Without `bucket` this returns the dashboard's this/last week and month
+    comparison. With bucket=day|week|month (plus optional from, to and
+    window) it returns the full series for trend charts. Either way the
+    logged values are read with a single grouped query.
+    """
     habit_description = request.args.get('description')
     if not habit_description:
         return jsonify({'error': 'Habit description is required'}), 400
 
-    habit_info = RecurringTask.query.filter_by(user_id=current_user.id, description=habit_description).first()
-    if not habit_info:
-        habit_info = Task.query.filter_by(user_id=current_user.id, description=habit_description).first()
+    # The recurring template wins over a one-off task with the same description
+    habit_info = db.session.execute(
+        db.union_all(
+            db.select(RecurringTask.is_negative_habit, RecurringTask.numeric_unit, db.literal(0).label('source')).where(
+                RecurringTask.user_id == current_user.id, RecurringTask.description == habit_description
+            ),
+            db.select(Task.is_negative_habit, Task.numeric_unit, db.literal(1).label('source')).where(
+                Task.user_id == current_user.id, Task.description == habit_description
+            )
+        ).order_by(text('source')).limit(1)
+    ).first()
     
     is_negative = habit_info.is_negative_habit if habit_info else False
     unit = habit_info.numeric_unit if habit_info else ''
 
     today = date.today()
     
+    bucket = request.args.get('bucket')
+    if bucket:
+        if bucket not in HABIT_BUCKETS:
+            return jsonify({'error': f"bucket must be one of {', '.join(HABIT_BUCKETS)}"}), 400
+        try:
+            end = date.fromisoformat(request.args.get('to', today.isoformat()))
+            start = date.fromisoformat(request.args.get('from', (end - timedelta(days=365)).isoformat()))
+        except ValueError:
+            return jsonify({'error': 'from and to must be YYYY-MM-DD dates'}), 400
+        if end < start or (end - start).days >= HABIT_MAX_DAYS:
+            return jsonify({'error': f'Range must span 1-{HABIT_MAX_DAYS} days'}), 400
+        window = max(request.args.get('window', 3, type=int), 1)
+        
+        daily = habit_daily_totals(current_user.id, habit_description, start, end)
+        return jsonify({
+            'bucket': bucket,
+            'buckets': habit_buckets(daily, bucket, start, end, is_negative, window),
+            'unit': unit,
+            'is_negative': is_negative
+        })
+    
     start_of_this_week = today - timedelta(days=today.weekday())
     start_of_last_week = start_of_this_week - timedelta(days=7)
-    
-    def get_week_stats(start_date):
-        end_date = start_date + timedelta(days=6)
-        stats = db.session.query(
-            func.sum(Task.logged_numeric_value),
-            func.avg(Task.logged_numeric_value),
-            func.count(Task.task_id)
-        ).filter(
-            Task.user_id == current_user.id,
-            Task.description == habit_description,
-            Task.is_completed == True,
-            Task.logged_numeric_value.isnot(None),
-            Task.date >= start_date.isoformat(),
-            Task.date <= end_date.isoformat()
-        ).first()
-        return {'total': stats[0] or 0, 'avg': stats[1] or 0, 'entries': stats[2] or 0}
-
-    this_week_stats = get_week_stats(start_of_this_week)
-    last_week_stats = get_week_stats(start_of_last_week)
-
+    end_of_this_week = start_of_this_week + timedelta(days=6)
     start_of_this_month = today.replace(day=1)
     start_of_last_month = (start_of_this_month - timedelta(days=1)).replace(day=1)
-
-    def get_month_stats(start_date):
-        end_date = (start_date.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
-        stats = db.session.query(
-            func.sum(Task.logged_numeric_value),
-            func.avg(Task.logged_numeric_value),
-            func.count(Task.task_id)
-        ).filter(
-            Task.user_id == current_user.id,
-            Task.description == habit_description,
-            Task.is_completed == True,
-            Task.logged_numeric_value.isnot(None),
-            Task.date >= start_date.isoformat(),
-            Task.date <= end_date.isoformat()
-        ).first()
-        return {'total': stats[0] or 0, 'avg': stats[1] or 0, 'entries': stats[2] or 0}
-
-    this_month_stats = get_month_stats(start_of_this_month)
-    last_month_stats = get_month_stats(start_of_last_month)
+    end_of_this_month = next_bucket(start_of_this_month, 'month') - timedelta(days=1)
     
-    def calc_change(current, previous, is_negative_habit):
-        if previous > 0:
-            if is_negative_habit:
-                return round(((previous - current) / previous) * 100, 1)
-            else:
-                return round(((current - previous) / previous) * 100, 1)
-        elif current > 0:
-            return 100 if not is_negative_habit else -100
-        return 0
+    daily = habit_daily_totals(current_user.id, habit_description,
+                               min(start_of_last_week, start_of_last_month),
+                               max(end_of_this_week, end_of_this_month))
+    last_week, this_week = habit_buckets(daily, 'week', start_of_last_week, end_of_this_week, is_negative)
+    last_month, this_month = habit_buckets(daily, 'month', start_of_last_month, end_of_this_month, is_negative)
+    
+    def period(bucket):
+        return {'total': bucket['total'], 'avg': bucket['avg'], 'entries': bucket['entries']}
 
     return jsonify({
         'week': {
-            'this_week': this_week_stats,
-            'last_week': last_week_stats,
-            'total_change': calc_change(this_week_stats['total'], last_week_stats['total'], is_negative),
-            'avg_change': calc_change(this_week_stats['avg'], last_week_stats['avg'], is_negative)
+            'this_week': period(this_week),
+            'last_week': period(last_week),
+            'total_change': this_week['total_change'],
+            'avg_change': this_week['avg_change']
         },
         'month': {
-            'this_month': this_month_stats,
-            'last_month': last_month_stats,
-            'total_change': calc_change(this_month_stats['total'], last_month_stats['total'], is_negative),
-            'avg_change': calc_change(this_month_stats['avg'], last_month_stats['avg'], is_negative)
+            'this_month': period(this_month),
+            'last_month': period(last_month),
+            'total_change': this_month['total_change'],
+            'avg_change': this_month['avg_change']
         },
         'unit': unit,
         'is_negative': is_negative
     })
 
 # --- QUESTS & QUEST STEPS API ---
+def load_quests(user_id):
+    """Quests with their step totals in one query, every quest's steps in a second"""
+    totals = quest_step_totals(Quest.user_id == user_id)
+    rows = db.session.execute(
+        db.select(Quest, totals.c.step_count, totals.c.steps_completed)
+        .outerjoin(totals, totals.c.quest_id == Quest.quest_id)
+        .where(Quest.user_id == user_id)
+        .options(*QUEST_LOADS)
+        .order_by(
+            (Quest.status == 'Active').desc(),
+            Quest.due_date.asc().nullslast(),
+            Quest.start_date.desc()
+        )
+    ).all()
+    
+    return [serialize_quest(quest, (step_count or 0, steps_completed or 0))
+            for quest, step_count, steps_completed in rows]
+
 @app.route('/api/quests')
 @login_required
 def api_get_quests():
-    quests = Quest.query.filter_by(user_id=current_user.id).order_by(
-        (Quest.status == 'Active').desc(),
-        Quest.due_date.asc().nullslast(),
-        Quest.start_date.desc()
-    ).all()
-    
-    quests_data = []
-    for quest in quests:
-        steps_data = []
-        # UPDATED: Eagerly load steps for each quest
-        for step in quest.steps.order_by(QuestStep.id):
-            steps_data.append({
-                'id': step.id,
-                'description': step.description,
-                'is_completed': step.is_completed
-            })
-
-        quests_data.append({
-            'id': quest.quest_id,
-            'title': quest.title,
-            'description': quest.description,
-            'difficulty': quest.difficulty,
-            'xp_reward': quest.xp_reward,
-            'attribute_focus': quest.attribute_focus,
-            'start_date': quest.start_date,
-            'due_date': quest.due_date,
-            'completed_date': quest.completed_date,
-            'status': quest.status,
-            'steps': steps_data  # NEW: Include steps in response
-        })
-    
-    return jsonify(quests_data)
+    return jsonify(load_quests(current_user.id))
 
 @app.route('/api/add_quest', methods=['POST'])
 @login_required
@@ -1301,9 +2646,13 @@ def api_add_quest():
     )
     
     db.session.add(quest)
+    bump_counters(current_user.id, active_quests=1)
+    db.session.flush()
+    emit_event(current_user.id, 'quest', quest=serialize_quest(quest))
+    emit_stats(current_user.id)
     db.session.commit()
     
-    return jsonify({'success': True, 'quest_id': quest.quest_id})
+    return jsonify({'success': True, 'quest_id': quest.quest_id, 'events': emitted_events()})
 
 # NEW: Endpoint to edit a quest's details
 @app.route('/api/quests/<int:quest_id>', methods=['PUT'])
@@ -1315,8 +2664,9 @@ def update_quest(quest_id):
     quest.title = data.get('title', quest.title)
     quest.description = data.get('description', quest.description)
     
+    emit_event(current_user.id, 'quest', quest=serialize_quest(quest))
     db.session.commit()
-    return jsonify({'success': True, 'message': 'Quest updated.'})
+    return jsonify({'success': True, 'message': 'Quest updated.', 'events': emitted_events()})
 
 
 @app.route('/api/complete_quest', methods=['POST'])
@@ -1325,16 +2675,17 @@ def api_complete_quest():
     data = request.json
     quest_id = data.get('quest_id')
     
-    quest = Quest.query.filter_by(quest_id=quest_id, user_id=current_user.id).first()
+    quest = Quest.query.options(*QUEST_LOADS).filter_by(quest_id=quest_id, user_id=current_user.id).first()
     if not quest or quest.status == 'Completed':
         return jsonify({'success': False, 'error': 'Quest not found or already completed'})
     
     # NEW: Check if all steps are completed
-    incomplete_steps = quest.steps.filter_by(is_completed=False).count()
+    incomplete_steps = sum(1 for step in quest.steps if not step.is_completed)
     if incomplete_steps > 0:
         return jsonify({'success': False, 'error': f'Cannot complete quest. {incomplete_steps} steps remaining.'}), 400
 
     today = datetime.date.today().isoformat()
+    was_active = quest.status == 'Active'
     quest.status = 'Completed'
     quest.completed_date = today
     
@@ -1344,7 +2695,8 @@ def api_complete_quest():
             name=quest.attribute_focus
         ).first()
         if attribute:
-            attribute.current_xp += quest.xp_reward
+            add_xp(current_user.id, attribute, quest.xp_reward, 'quest', quest.quest_id, today)
+            emit_attributes(attribute)
     
     milestone = Milestone(
         user_id=current_user.id,
@@ -1355,9 +2707,13 @@ def api_complete_quest():
     )
     db.session.add(milestone)
     
+    bump_counters(current_user.id, active_quests=-int(was_active), completed_quests=1)
+    emit_event(current_user.id, 'quest', quest=serialize_quest(quest))
+    emit_event(current_user.id, 'milestones')
+    emit_stats(current_user.id)
     db.session.commit()
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'events': emitted_events()})
 
 # NEW: Endpoint to add a quest step
 @app.route('/api/quests/<int:quest_id>/steps', methods=['POST'])
@@ -1372,6 +2728,8 @@ def add_quest_step(quest_id):
 
     step = QuestStep(quest_id=quest.quest_id, description=description)
     db.session.add(step)
+    db.session.flush()
+    emit_event(current_user.id, 'quest', quest=serialize_quest(quest))
     db.session.commit()
 
     return jsonify({
@@ -1380,7 +2738,8 @@ def add_quest_step(quest_id):
             'id': step.id, 
             'description': step.description,
             'is_completed': step.is_completed
-        }
+        },
+        'events': emitted_events()
     }), 201
 
 # NEW: Endpoint to toggle a quest step's completion
@@ -1393,8 +2752,9 @@ def toggle_quest_step(step_id):
         return jsonify({'success': False, 'error': 'Forbidden'}), 403
 
     step.is_completed = not step.is_completed
+    emit_event(current_user.id, 'quest', quest=serialize_quest(step.quest))
     db.session.commit()
-    return jsonify({'success': True, 'is_completed': step.is_completed})
+    return jsonify({'success': True, 'is_completed': step.is_completed, 'events': emitted_events()})
 
 # NEW: Endpoint to delete a quest step
 @app.route('/api/quest_steps/<int:step_id>', methods=['DELETE'])
@@ -1404,9 +2764,12 @@ def delete_quest_step(step_id):
     if step.quest.user_id != current_user.id:
         return jsonify({'success': False, 'error': 'Forbidden'}), 403
     
+    quest = step.quest
     db.session.delete(step)
+    db.session.flush()
+    emit_event(current_user.id, 'quest', quest=serialize_quest(quest))
     db.session.commit()
-    return jsonify({'success': True, 'message': 'Step deleted.'})
+    return jsonify({'success': True, 'message': 'Step deleted.', 'events': emitted_events()})
 
 @app.route('/api/generate_quest', methods=['POST'])
 @login_required
@@ -1424,7 +2787,7 @@ def api_generate_quest():
     
     response = generate_ai_response(prompt,
                                   "You are a quest master creating real-life self-improvement quests.",
-                                  api_key)
+                                  api_key, use_cache=True)
     
     lines = response.split('\n')
     title = "New Quest"
@@ -1480,34 +2843,33 @@ Keep it to one powerful sentence (15-25 words). Make it sound legendary and pers
     
     enhanced = generate_ai_response(prompt,
                                   "You are a master storyteller creating unique fantasy quest descriptions. Avoid repetitive language and generic fantasy tropes.",
-                                  api_key)
+                                  api_key, use_cache=True)
     
     return jsonify({'enhanced_description': enhanced})
 
+@app.route('/api/ai_cache_stats')
+@login_required
+def api_get_ai_cache_stats():
+    """Hit/miss counters for this process's AI response cache"""
+    return jsonify(ai_cache.stats())
+
+@app.route('/api/user_cache_stats')
+@login_required
+def api_get_user_cache_stats():
+    """Hit/miss counters for this process's login identity cache"""
+    return jsonify(user_cache.stats())
+
+def load_recurring_tasks(user_id):
+    recurring_tasks = RecurringTask.query.options(*RECURRING_TASK_LOADS).filter_by(
+        user_id=user_id
+    ).order_by(RecurringTask.is_active.desc(), RecurringTask.description).all()
+    
+    return [serialize_recurring_task(rt) for rt in recurring_tasks]
+
 @app.route('/api/recurring_tasks', methods=['GET'])
 @login_required
 def api_get_recurring_tasks():
-    recurring_tasks = RecurringTask.query.filter_by(user_id=current_user.id).order_by(
-        RecurringTask.is_active.desc(), RecurringTask.description
-    ).all()
-    
-    tasks_data = []
-    for rt in recurring_tasks:
-        tasks_data.append({
-            'recurring_task_id': rt.recurring_task_id,
-            'description': rt.description,
-            'attribute_name': rt.attribute.name if rt.attribute else None,
-            'subskill_name': rt.subskill.name if rt.subskill else None,
-            'xp_value': rt.xp_value,
-            'stress_effect': rt.stress_effect,
-            'is_negative_habit': rt.is_negative_habit,
-            'is_active': rt.is_active,
-            'last_added_date': rt.last_added_date,
-            'numeric_value': rt.numeric_value,
-            'numeric_unit': rt.numeric_unit
-        })
-    
-    return jsonify(tasks_data)
+    return jsonify(load_recurring_tasks(current_user.id))
 
 @app.route('/api/recurring_tasks', methods=['POST'])
 @login_required
@@ -1554,6 +2916,10 @@ def api_delete_recurring_task(rt_id):
     ).first()
     
     if recurring_task:
+        # Generated tasks are kept; detach them from the template first
+        Task.query.filter_by(recurring_task_id=rt_id).update(
+            {'recurring_task_id': None}, synchronize_session=False
+        )
         db.session.delete(recurring_task)
         db.session.commit()
         return jsonify({'success': True})
@@ -1576,40 +2942,92 @@ def api_toggle_recurring_task(rt_id):
     
     return jsonify({'success': True, 'is_active': recurring_task.is_active})
 
+RESET_MAX_DAYS = 31
+
+def reset_days(user_id, start, end):
+    """Delete a user's tasks dated start..end (inclusive) and undo what they recorded.
+
+    A fixed number of set-based statements whatever the range: one aggregate
+    gives the XP to take back per attribute/subskill and day, which becomes
+    one UPDATE per changed row plus its ledger entries; the tasks, rollups
+    and narratives go in one bulk DELETE each.
+    """
+    in_range = (Task.user_id == user_id, Task.date >= start, Task.date <= end)
+    earned = (*in_range, Task.is_completed == True, Task.is_negative_habit == False, Task.xp_gained > 0)
+    xp_rows = db.session.execute(db.union_all(
+        db.select(Attribute.attribute_id, db.null(), Attribute.current_xp, Task.date, func.sum(Task.xp_gained))
+        .join(Task, Task.attribute_id == Attribute.attribute_id).where(*earned)
+        .group_by(Attribute.attribute_id, Attribute.current_xp, Task.date),
+        db.select(Subskill.attribute_id, Subskill.subskill_id, Subskill.current_xp, Task.date, func.sum(Task.xp_gained))
+        .join(Task, Task.subskill_id == Subskill.subskill_id).where(*earned)
+        .group_by(Subskill.attribute_id, Subskill.subskill_id, Subskill.current_xp, Task.date)
+    )).all()
+    
+    # Floor each attribute/subskill at 0 day by day, as deleting the tasks in date order would
+    remaining, taken_back, events = {}, {}, []
+    for attribute_id, subskill_id, current_xp, date, xp in sorted(xp_rows, key=lambda row: row[3]):
+        key = (attribute_id, subskill_id)
+        left = remaining.get(key, current_xp or 0)
+        taken = min(xp or 0, left)
+        if taken:
+            remaining[key] = left - taken
+            taken_back[key] = taken_back.get(key, 0) + taken
+            events.append({'user_id': user_id, 'attribute_id': attribute_id, 'subskill_id': subskill_id,
+                           'source': 'day_reset', 'source_id': None, 'delta': -taken, 'date': date})
+    append_xp_events(events)
+    for table, key_column, keyed in (
+        (Attribute.__table__, 'attribute_id', {attribute_id: xp for (attribute_id, subskill_id), xp in taken_back.items() if subskill_id is None}),
+        (Subskill.__table__, 'subskill_id', {subskill_id: xp for (_, subskill_id), xp in taken_back.items() if subskill_id is not None}),
+    ):
+        if keyed:
+            db.session.execute(
+                table.update().where(table.c[key_column] == db.bindparam('target_id')).values(
+                    current_xp=table.c.current_xp - db.bindparam('taken')
+                ),
+                [{'target_id': target_id, 'taken': xp} for target_id, xp in keyed.items()]
+            )
+    
+    counter_totals = db.session.execute(task_counter_totals(*in_range)).mappings().one()
+    bump_counters(user_id, **{name: -count for name, count in counter_totals.items()})
+    tasks_deleted = Task.query.filter(*in_range).delete(synchronize_session=False)
+    
+    DailyStat.query.filter(
+        DailyStat.user_id == user_id, DailyStat.date >= start, DailyStat.date <= end
+    ).delete(synchronize_session=False)
+    RecurringTask.query.filter(
+        RecurringTask.user_id == user_id, RecurringTask.last_added_date >= start, RecurringTask.last_added_date <= end
+    ).update({'last_added_date': None}, synchronize_session=False)
+    DailyNarrative.query.filter(
+        DailyNarrative.user_id == user_id, DailyNarrative.date >= start, DailyNarrative.date <= end
+    ).delete(synchronize_session=False)
+    return tasks_deleted
+
 @app.route('/api/reset_day', methods=['POST'])
 @login_required
 def api_reset_day():
-    data = request.json
-    date = data.get('date', datetime.date.today().isoformat())
+    # {"date": ...} resets one day; {"from": ..., "to": ...} an inclusive range of them
+    data = request.json or {}
+    if 'from' in data:
+        try:
+            start = datetime.date.fromisoformat(data['from'])
+            end = datetime.date.fromisoformat(data.get('to') or data['from'])
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'from and to must be YYYY-MM-DD dates'}), 400
+        if end < start or (end - start).days >= RESET_MAX_DAYS:
+            return jsonify({'success': False, 'error': f'Range must span 1-{RESET_MAX_DAYS} days'}), 400
+        start, end = start.isoformat(), end.isoformat()
+        dates = {'from': start, 'to': end}
+    else:
+        start = end = data.get('date', datetime.date.today().isoformat())
+        dates = {'date': start}
     
     try:
-        completed_tasks = Task.query.filter_by(
-            user_id=current_user.id,
-            date=date,
-            is_completed=True,
-            is_negative_habit=False
-        ).all()
-        
-        for task in completed_tasks:
-            if task.attribute and task.xp_gained > 0:
-                task.attribute.current_xp = max(0, task.attribute.current_xp - task.xp_gained)
-            if task.subskill and task.xp_gained > 0:
-                task.subskill.current_xp = max(0, task.subskill.current_xp - task.xp_gained)
-        
-        tasks_to_delete = Task.query.filter_by(user_id=current_user.id, date=date).all()
-        tasks_deleted = len(tasks_to_delete)
-        for task in tasks_to_delete:
-            db.session.delete(task)
-        
-        DailyStat.query.filter_by(user_id=current_user.id, date=date).delete()
-        
-        DailyNarrative.query.filter_by(user_id=current_user.id, date=date).delete()
-        
+        tasks_deleted = reset_days(current_user.id, start, end)
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'date': date,
+            **dates,
             'tasks_deleted': tasks_deleted
         })
         
@@ -1617,19 +3035,6 @@ def api_reset_day():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/add-negative-habit-column')
-def add_negative_habit_column():
-    """Add the new negative_habit_done column to existing tasks table"""
-    try:
-        with db.engine.connect() as connection:
-            connection.execute(text('ALTER TABLE task ADD COLUMN negative_habit_done BOOLEAN DEFAULT NULL'))
-            connection.commit()
-        return "Successfully added negative_habit_done column to task table!"
-    except Exception as e:
-        if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
-            return "Column already exists - no action needed!"
-        return f"Error adding column: {str(e)}"
-
 @app.route('/api/story_progress')
 @login_required
 def api_get_story_progress():
@@ -1652,16 +3057,19 @@ def api_get_story_progress():
         'recent_events': progress.recent_events
     })
 
-@app.route('/api/credo', methods=['GET'])
-@login_required
-def get_credo():
-    credo = Credo.query.filter_by(user_id=current_user.id).first()
+def load_credo(user_id):
+    credo = Credo.query.filter_by(user_id=user_id).first()
     if not credo:
         # Create a default credo for the user if it doesn't exist
-        credo = Credo(user_id=current_user.id)
+        credo = Credo(user_id=user_id)
         db.session.add(credo)
         db.session.commit()
-    return jsonify({'content': credo.content})
+    return {'content': credo.content}
+
+@app.route('/api/credo', methods=['GET'])
+@login_required
+def get_credo():
+    return jsonify(load_credo(current_user.id))
 
 @app.route('/api/credo', methods=['POST'])
 @login_required
@@ -1677,16 +3085,95 @@ def update_credo():
     return jsonify({'success': True, 'content': credo.content})
 
 # --- NEW: NOTES API ---
+NOTE_PREVIEW_CHARS = 150
+NOTE_SEARCH_LIMIT = 20
+# Private-use characters bracket search hits so the snippet can be escaped
+# before the markers become <mark> tags
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+
+def load_notes(user_id):
+    # Sidebar projection: the body stays in the database until a note is opened
+    notes = db.session.execute(
+        db.select(
+            Note.id, Note.title, Note.updated_at,
+            func.substr(Note.content, 1, NOTE_PREVIEW_CHARS + 1).label('preview')
+        ).where(Note.user_id == user_id).order_by(Note.updated_at.desc())
+    ).all()
+    return [{
+        'id': note.id,
+        'title': note.title,
+        'preview': note.preview[:NOTE_PREVIEW_CHARS] + '...' if len(note.preview or '') > NOTE_PREVIEW_CHARS else (note.preview or ''),
+        'updated_at': note.updated_at.strftime('%Y-%m-%d %H:%M')
+    } for note in notes]
+
 @app.route('/api/notes', methods=['GET'])
 @login_required
 def get_notes():
-    notes = Note.query.filter_by(user_id=current_user.id).order_by(Note.updated_at.desc()).all()
-    return jsonify([{
+    return jsonify(load_notes(current_user.id))
+
+@app.route('/api/notes/<int:note_id>', methods=['GET'])
+@login_required
+def get_note(note_id):
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    return jsonify({
         'id': note.id,
         'title': note.title,
         'content': note.content,
         'updated_at': note.updated_at.strftime('%Y-%m-%d %H:%M')
-    } for note in notes])
+    })
+
+def search_notes(user_id, query):
+    """Ranked matches from the notes full-text index (see migration 5)"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return []
+    
+    if db.engine.dialect.name == 'sqlite':
+        # Every word must match; the last is a prefix so results follow typing
+        match = ' '.join(f'"{word}"' for word in words) + '*'
+        rows = db.session.execute(text(
+            "SELECT note.id, note.title, note.updated_at, "
+            "snippet(note_fts, 1, :start, :end, '...', 16) AS snippet, "
+            "highlight(note_fts, 0, :start, :end) AS title_match "
+            "FROM note_fts JOIN note ON note.id = note_fts.rowid "
+            "WHERE note_fts MATCH :match AND note.user_id = :user_id "
+            "ORDER BY bm25(note_fts, 5.0, 1.0) LIMIT :limit"
+        ), {'match': match, 'user_id': user_id, 'start': MATCH_START, 'end': MATCH_END,
+            'limit': NOTE_SEARCH_LIMIT}).all()
+    else:
+        # Rank in the inner query so ts_headline only runs on the rows returned
+        rows = db.session.execute(text(
+            "SELECT hit.id, hit.title, hit.updated_at, "
+            "ts_headline('simple', coalesce(hit.content, ''), hit.query, "
+            "  'StartSel=' || :start || ', StopSel=' || :end || ', MaxWords=30, MinWords=10') AS snippet, "
+            "ts_headline('simple', hit.title, hit.query, "
+            "  'StartSel=' || :start || ', StopSel=' || :end || ', HighlightAll=true') AS title_match "
+            "FROM (SELECT note.id, note.title, note.content, note.updated_at, q.query, "
+            "        ts_rank(note.search_vector, q.query) AS rank "
+            "      FROM note, to_tsquery('simple', :match) AS q(query) "
+            "      WHERE note.user_id = :user_id AND note.search_vector @@ q.query "
+            "      ORDER BY rank DESC LIMIT :limit) AS hit "
+            "ORDER BY hit.rank DESC"
+        ), {'match': ' & '.join(words) + ':*', 'user_id': user_id, 'start': MATCH_START,
+            'end': MATCH_END, 'limit': NOTE_SEARCH_LIMIT}).all()
+    
+    def highlight(fragment):
+        return str(escape(fragment or '')).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+    
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'title_html': highlight(row.title_match),
+        'snippet_html': highlight(row.snippet),
+        'updated_at': (row.updated_at if isinstance(row.updated_at, datetime.datetime)
+                       else datetime.datetime.fromisoformat(row.updated_at)).strftime('%Y-%m-%d %H:%M')
+    } for row in rows]
+
+@app.route('/api/notes/search')
+@login_required
+def api_search_notes():
+    query = request.args.get('q', '').strip()
+    return jsonify({'query': query, 'results': search_notes(current_user.id, query)})
 
 @app.route('/api/notes', methods=['POST'])
 @login_required
@@ -1723,11 +3210,17 @@ def delete_note(note_id):
     return jsonify({'success': True})
 
 # --- NEW: DAILY CHECKLIST API ---
+def active_checklist_items(user_id):
+    return DailyChecklistItem.query.filter_by(user_id=user_id, is_active=True).order_by(DailyChecklistItem.id).all()
+
+def load_checklist_items(user_id, items=None):
+    items = active_checklist_items(user_id) if items is None else items
+    return [{'id': item.id, 'question': item.question} for item in items]
+
 @app.route('/api/daily_checklist_items', methods=['GET'])
 @login_required
 def get_daily_checklist_items():
-    items = DailyChecklistItem.query.filter_by(user_id=current_user.id, is_active=True).order_by(DailyChecklistItem.id).all()
-    return jsonify([{'id': item.id, 'question': item.question} for item in items])
+    return jsonify(load_checklist_items(current_user.id))
 
 @app.route('/api/daily_checklist_items', methods=['POST'])
 @login_required
@@ -1752,16 +3245,12 @@ def delete_daily_checklist_item(item_id):
     db.session.commit()
     return jsonify({'success': True})
 
-@app.route('/api/daily_checklist_logs', methods=['GET'])
-@login_required
-def get_daily_checklist_logs():
-    date = request.args.get('date', datetime.date.today().isoformat())
-    
-    # Get all active items for the user
-    items = DailyChecklistItem.query.filter_by(user_id=current_user.id, is_active=True).all()
+def load_checklist_logs(user_id, date, items=None):
+    # Get all active items for the user (callers that already have them pass them in)
+    items = active_checklist_items(user_id) if items is None else items
     
     # Get all logs for that specific day
-    logs = DailyChecklistLog.query.filter_by(user_id=current_user.id, date=date).all()
+    logs = DailyChecklistLog.query.filter_by(user_id=user_id, date=date).all()
     logs_by_item_id = {log.item_id: log.status for log in logs}
 
     # Combine them
@@ -1773,7 +3262,13 @@ def get_daily_checklist_logs():
             'status': logs_by_item_id.get(item.id, None) # Status is null if not logged
         })
     
-    return jsonify(checklist_data)
+    return checklist_data
+
+@app.route('/api/daily_checklist_logs', methods=['GET'])
+@login_required
+def get_daily_checklist_logs():
+    date = request.args.get('date', datetime.date.today().isoformat())
+    return jsonify(load_checklist_logs(current_user.id, date))
 
 @app.route('/api/daily_checklist_logs', methods=['POST'])
 @login_required
@@ -1792,24 +3287,593 @@ def log_daily_checklist_item():
         return jsonify({'success': False, 'error': 'Item not found'}), 404
 
     log = DailyChecklistLog.query.filter_by(item_id=item_id, date=date, user_id=current_user.id).first()
-    
+    set_checklist_status(current_user.id, item_id, date, status, log)
+        
+    db.session.commit()
+    return jsonify({'success': True})
+
+def set_checklist_status(user_id, item_id, date, status, log):
+    """Log, change or clear a checklist answer; returns the log row left in place (or None)"""
     if log:
         # If user clicks the same button again, un-log it. Otherwise, update it.
         if log.status == status:
-            db.session.delete(log)
-        else:
-            log.status = status
+            if db.inspect(log).pending:
+                # Added earlier in the same batch and never written
+                db.session.expunge(log)
+            else:
+                db.session.delete(log)
+                # Flush now so a batch that logs the same answer again can
+                # insert without tripping the unique constraint
+                db.session.flush()
+            return None
+        log.status = status
+        return log
+    log = DailyChecklistLog(item_id=item_id, user_id=user_id, date=date, status=status)
+    db.session.add(log)
+    return log
+
+# --- BATCH MUTATIONS ---
+BATCH_MAX_OPERATIONS = 100
+BATCH_TASK_OPS = ('complete_task', 'complete_negative_habit', 'skip_task')
+
+def is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def batch_operation_error(op):
+    """Why op is malformed, or None; checked for every operation before anything is loaded"""
+    if not isinstance(op, dict):
+        return 'Each operation must be an object'
+    kind = op.get('op')
+    if kind in BATCH_TASK_OPS:
+        if not is_id(op.get('task_id')):
+            return 'task_id must be an integer'
+        if kind == 'complete_negative_habit' and not isinstance(op.get('did_negative'), bool):
+            return 'did_negative must be true or false'
+    elif kind == 'log_checklist_item':
+        if not is_id(op.get('item_id')) or not all(isinstance(op.get(field), str) and op[field] for field in ('date', 'status')):
+            return 'Missing required fields'
     else:
-        log = DailyChecklistLog(item_id=item_id, user_id=current_user.id, date=date, status=status)
-        db.session.add(log)
+        return f'Unknown op: {kind}'
+    return None
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def api_batch():
+    """Apply an ordered list of operations in one transaction.
+
+    Each operation is {"op": ..., **fields} where op is complete_task,
+    complete_negative_habit, skip_task or log_checklist_item and the fields
+    are the ones the single-action endpoint takes. The tasks, checklist items
+    and logs involved are loaded up front; XP, stress and DailyStat are
+    incremented once for the whole batch. If any operation fails nothing is committed and the
+    response names the failing index.
+    """
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'error': 'operations must be a non-empty list'}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'success': False, 'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 400
+    for index, op in enumerate(operations):
+        error = batch_operation_error(op)
+        if error:
+            return jsonify({'success': False, 'failed_index': index, 'error': error, 'results': []}), 400
+    
+    user_id = current_user.id
+    task_ids = {op.get('task_id') for op in operations if op.get('op') in BATCH_TASK_OPS}
+    tasks = {task.task_id: task for task in Task.query.options(*TASK_LOADS).filter(
+        Task.user_id == user_id, Task.task_id.in_(task_ids)
+    )} if task_ids else {}
+    
+    checklist_ops = [op for op in operations if op.get('op') == 'log_checklist_item']
+    items, logs = set(), {}
+    if checklist_ops:
+        item_ids = {op.get('item_id') for op in checklist_ops}
+        items = set(db.session.execute(db.select(DailyChecklistItem.id).where(
+            DailyChecklistItem.user_id == user_id, DailyChecklistItem.id.in_(item_ids)
+        )).scalars())
+        logs = {(log.item_id, log.date): log for log in DailyChecklistLog.query.filter(
+            DailyChecklistLog.user_id == user_id,
+            DailyChecklistLog.item_id.in_(item_ids),
+            DailyChecklistLog.date.in_({op.get('date') for op in checklist_ops})
+        )}
+    
+    rows = new_mutation_rows()
+    results = []
+    for index, op in enumerate(operations):
+        kind = op.get('op')
+        if kind == 'complete_task':
+            result = apply_complete_task(tasks.get(op.get('task_id')), op.get('logged_numeric_value'), rows)
+        elif kind == 'complete_negative_habit':
+            result = apply_complete_negative_habit(tasks.get(op.get('task_id')), op.get('did_negative'), rows)
+        elif kind == 'skip_task':
+            result = apply_skip_task(tasks.get(op.get('task_id')), rows)
+        else:
+            key = (op['item_id'], op['date'])
+            if key[0] not in items:
+                result = {'success': False, 'error': 'Item not found'}
+            else:
+                logs[key] = set_checklist_status(user_id, key[0], key[1], op['status'], logs.get(key))
+                result = {'success': True, 'status': logs[key].status if logs[key] else None}
         
+        if not result['success']:
+            db.session.rollback()
+            g.events = []
+            return jsonify({'success': False, 'failed_index': index, 'error': result['error'], 'results': results}), 400
+        results.append(result)
+    
+    if task_ids:
+        finish_task_mutations(user_id, rows)
     db.session.commit()
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'results': results, 'events': emitted_events()})
+
+
+# --- DASHBOARD BOOTSTRAP ---
+@app.route('/api/bootstrap')
+@login_required
+def api_bootstrap():
+    """Everything the dashboard renders on load, in one response.
+
+    Accepts the same parameters the individual endpoints take so the client
+    can restore its view: date, checklist_date, year, month and the cursor
+    and page size of the milestone and narrative histories.
+    """
+    today = datetime.date.today()
+    user_id = current_user.id
+    date = request.args.get('date', today.isoformat())
+    checklist_date = request.args.get('checklist_date', date)
+    year = request.args.get('year', today.year, type=int)
+    month = request.args.get('month', today.month, type=int)
+    
+    checklist_items = active_checklist_items(user_id)
+    
+    try:
+        milestones = load_milestones(
+            user_id,
+            request.args.get('milestones_cursor'),
+            request.args.get('milestones_limit', 5, type=int)
+        )
+        narratives = load_narratives(
+            user_id,
+            request.args.get('narratives_cursor'),
+            request.args.get('narratives_limit', 3, type=int)
+        )
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'date': date,
+        'attributes': load_attributes(user_id),
+        'tasks': load_tasks(user_id, date),
+        'stats': load_stats(user_id),
+        'recurring_tasks': load_recurring_tasks(user_id),
+        'quests': load_quests(user_id),
+        'milestones': milestones,
+        'narrative': load_narrative(user_id, date),
+        'narratives': narratives,
+        'heatmap': load_heatmap(user_id, year, month),
+        'numeric_habits': load_numeric_habits(user_id),
+        'credo': load_credo(user_id),
+        'notes': load_notes(user_id),
+        'checklist_items': load_checklist_items(user_id, checklist_items),
+        'checklist_logs': load_checklist_logs(user_id, checklist_date, checklist_items)
+    })
 
+# --- LIVE EVENT STREAM ---
+@app.route('/api/events')
+@login_required
+def api_events():
+    """Server-sent events carrying the deltas recorded by emit_event.
+
+    Each stream lives for EVENT_STREAM_SECONDS and then closes; the browser's
+    EventSource reconnects with Last-Event-ID and resumes where it left off.
+    A new stream without one starts from the latest event.
+    
+    A stream holds its worker thread throughout, so each process serves at
+    most EVENT_STREAMS_PER_WORKER of them. Further ones get a 503, which
+    ends the EventSource for good; the client then polls its panels (cheap
+    ETag revalidations) and tries the stream again later.
+    """
+    user_id = current_user.id
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = db.session.execute(
+            db.select(func.max(UserEvent.id)).where(UserEvent.user_id == user_id)
+        ).scalar() or 0
+    
+    if not event_stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(EVENT_STREAM_RETRY_SECONDS)
+        return response
+    
+    def stream(last_id):
+        deadline = time.monotonic() + app.config['EVENT_STREAM_SECONDS']
+        yield 'retry: 2000\n\n'
+        while time.monotonic() < deadline:
+            # A short app context per poll so no connection is held while idle
+            with app.app_context():
+                events = db.session.execute(
+                    db.select(UserEvent.id, UserEvent.payload).where(
+                        UserEvent.user_id == user_id, UserEvent.id > last_id
+                    ).order_by(UserEvent.id).limit(100)
+                ).all()
+            for event_id, payload in events:
+                last_id = event_id
+                yield f"id: {event_id}\ndata: {payload}\n\n"
+            if not events:
+                with event_condition:
+                    notified = event_condition.wait(timeout=EVENT_POLL_SECONDS)
+                if not notified:
+                    yield ': keep-alive\n\n'
+    
+    response = Response(stream(last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # The server closes the response when the stream ends or the client goes away
+    response.call_on_close(event_stream_slots.release)
+    return response
+
+# --- Schema Migrations ---
+# db.create_all() only creates missing tables. Anything that changes an
+# existing table goes here as a numbered migration, applied once per database.
+MIGRATION_LOCK_KEY = 7_401_337
+
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+MIGRATIONS = []
+
+def migration(version):
+    """Register a migration function; versions are applied in ascending order"""
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        return fn
+    return register
+
+def column_names(connection, table_name):
+    return {column['name'] for column in db.inspect(connection).get_columns(table_name)}
+
+def create_model_indexes(connection, *index_names):
+    """Create indexes declared on the models (no-op for ones that already exist)"""
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in index_names:
+        indexes[name].create(connection, checkfirst=True)
+
+@migration(1)
+def add_negative_habit_done_column(connection):
+    if 'negative_habit_done' not in column_names(connection, 'task'):
+        connection.execute(text('ALTER TABLE task ADD COLUMN negative_habit_done BOOLEAN DEFAULT NULL'))
+
+@migration(2)
+def link_tasks_to_recurring_templates(connection):
+    if 'recurring_task_id' not in column_names(connection, 'task'):
+        connection.execute(text(
+            'ALTER TABLE task ADD COLUMN recurring_task_id INTEGER '
+            'REFERENCES recurring_task (recurring_task_id) ON DELETE SET NULL'
+        ))
+    create_model_indexes(connection, 'uq_task_user_date_recurring')
+
+@migration(3)
+def add_query_indexes(connection):
+    create_model_indexes(
+        connection,
+        'ix_task_user_description_date',
+        'ix_task_user_completed_negative',
+        'ix_quest_user_status',
+        'ix_quest_step_quest',
+        'ix_note_user_updated',
+        'ix_checklist_log_user_date',
+        'ix_milestone_user_date'
+    )
+
+@migration(4)
+def add_narrative_history_index(connection):
+    create_model_indexes(connection, 'ix_daily_narrative_user_date')
+
+@migration(5)
+def add_note_search_index(connection):
+    """Full-text index over note titles and bodies, kept current by the database itself.
+
+    Words are indexed unstemmed ('simple' / unicode61) so the prefix match on
+    the last search word works while the user is still typing it.
+    """
+    if connection.dialect.name == 'postgresql':
+        if 'search_vector' not in column_names(connection, 'note'):
+            connection.execute(text(
+                "ALTER TABLE note ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(content, '')), 'B')) STORED"
+            ))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_note_search_vector ON note USING GIN (search_vector)'
+        ))
+    elif connection.dialect.name == 'sqlite':
+        # External-content FTS5 table: the text lives in note, triggers keep the index in step
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5("
+            "title, content, content='note', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        connection.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS note_fts_insert AFTER INSERT ON note BEGIN "
+            "INSERT INTO note_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+        ))
+        connection.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS note_fts_delete AFTER DELETE ON note BEGIN "
+            "INSERT INTO note_fts(note_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); END"
+        ))
+        connection.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS note_fts_update AFTER UPDATE OF title, content ON note BEGIN "
+            "INSERT INTO note_fts(note_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+            "INSERT INTO note_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+        ))
+        connection.execute(text("INSERT INTO note_fts(note_fts) VALUES ('rebuild')"))
+
+@migration(6)
+def start_xp_ledger(connection):
+    """Seed XpEvent from the history that still exists, then balance it to current_xp.
+
+    Successful completions and completed quests become dated events; whatever
+    they do not explain (deleted tasks, resets, older rules) is booked as one
+    'opening' event per attribute or subskill dated today.
+    """
+    columns = ['user_id', 'attribute_id', 'subskill_id', 'source', 'source_id', 'delta', 'date', 'created_at']
+    now = db.literal(datetime.datetime.utcnow())
+    today = datetime.date.today().isoformat()
+    connection.execute(db.insert(XpEvent).from_select(columns, db.select(
+        Task.user_id, Task.attribute_id, db.null(), db.literal('task'), Task.task_id, TASK_CREDITED_XP, Task.date, now
+    ).where(TASK_SUCCEEDED, Task.attribute_id.isnot(None))))
+    connection.execute(db.insert(XpEvent).from_select(columns, db.select(
+        Task.user_id, Subskill.attribute_id, Task.subskill_id, db.literal('task'), Task.task_id, TASK_CREDITED_XP, Task.date, now
+    ).join(Subskill, Task.subskill_id == Subskill.subskill_id).where(TASK_SUCCEEDED)))
+    connection.execute(db.insert(XpEvent).from_select(columns, db.select(
+        Quest.user_id, Attribute.attribute_id, db.null(), db.literal('quest'), Quest.quest_id, Quest.xp_reward,
+        func.coalesce(Quest.completed_date, today), now
+    ).join(Attribute, db.and_(Attribute.user_id == Quest.user_id, Attribute.name == Quest.attribute_focus)).where(
+        Quest.status == 'Completed'
+    )))
+    reconcile_xp_ledger(connection, 'opening', today)
+
+@migration(7)
+def seed_user_counters(connection):
+    """Give every user a user_counter row, so reading stats never has to create one"""
+    missing = connection.execute(db.select(User.id).where(~User.counters.has())).scalars().all()
+    for user_id in missing:
+        totals = dict(connection.execute(counter_totals(user_id)).mappings().one())
+        connection.execute(db.insert(UserCounter).values(user_id=user_id, **totals))
+
+def run_migrations():
+    """Apply pending migrations in one transaction and return their names.
+
+    On Postgres an advisory lock serializes gunicorn workers that boot together.
+    """
+    applied_now = []
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        applied = set(connection.execute(db.select(SchemaMigration.version)).scalars())
+        for version, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in applied:
+                continue
+            fn(connection)
+            connection.execute(db.insert(SchemaMigration).values(version=version, name=fn.__name__))
+            applied_now.append(f"{version:04d}_{fn.__name__}")
+    return applied_now
+
+def index_plan_checks(user_id=0):
+    """The hot API queries paired with the index each one is expected to use"""
+    today = datetime.date.today().isoformat()
+    return [
+        ('/api/tasks', 'uq_task_user_date_recurring',
+         db.select(Task.task_id).where(Task.user_id == user_id, Task.date == today)),
+        ('/api/habit_progress', 'ix_task_user_description_date',
+         db.select(func.sum(Task.logged_numeric_value)).where(
+             Task.user_id == user_id, Task.description == 'habit', Task.date >= today)),
+        ('/api/stats', 'ix_task_user_completed_negative',
+         db.select(func.count(Task.task_id)).where(
+             Task.user_id == user_id, Task.is_completed == True, Task.is_negative_habit == True)),
+        ('/api/stats', 'ix_quest_user_status',
+         db.select(func.count(Quest.quest_id)).where(Quest.user_id == user_id, Quest.status == 'Active')),
+        ('/api/quests', 'ix_quest_step_quest',
+         db.select(QuestStep.id).where(QuestStep.quest_id == 0).order_by(QuestStep.id)),
+        ('/api/notes', 'ix_note_user_updated',
+         db.select(Note.id).where(Note.user_id == user_id).order_by(Note.updated_at.desc())),
+        ('/api/daily_checklist_logs', 'ix_checklist_log_user_date',
+         db.select(DailyChecklistLog.id).where(DailyChecklistLog.user_id == user_id, DailyChecklistLog.date == today)),
+        ('/api/milestones', 'ix_milestone_user_date',
+         db.select(Milestone.milestone_id).where(Milestone.user_id == user_id).order_by(
+             Milestone.date.desc(), Milestone.milestone_id.desc())),
+        ('/api/narratives', 'ix_daily_narrative_user_date',
+         db.select(DailyNarrative.id).where(
+             DailyNarrative.user_id == user_id,
+             db.tuple_(DailyNarrative.date, DailyNarrative.id) < (today, 0)
+         ).order_by(DailyNarrative.date.desc(), DailyNarrative.id.desc())),
+        ('/api/attribute_history', 'ix_xp_event_user_date',
+         db.select(func.sum(XpEvent.delta)).where(XpEvent.user_id == user_id, XpEvent.date >= today)),
+    ]
+
+def explain_query(connection, stmt):
+    """Return the query plan text for stmt on the current dialect"""
+    sql = str(stmt.compile(connection, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        return '\n'.join(row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+    # Small tables make a seq scan cheapest; disable it so we see whether the index is usable
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    return '\n'.join(row[0] for row in connection.execute(text('EXPLAIN ' + sql)))
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables and apply pending schema migrations."""
+    db.create_all()
+    applied = run_migrations()
+    print('\n'.join(f"Applied {name}" for name in applied) or 'Schema is up to date.')
+
+@app.cli.command('rebuild-stats-counters')
+def rebuild_stats_counters_command():
+    """Recompute every user's /api/stats counters from history."""
+    user_ids = db.session.execute(db.select(User.id)).scalars().all()
+    for user_id in user_ids:
+        rebuild_user_counters(user_id)
+    db.session.commit()
+    print(f"Rebuilt counters for {len(user_ids)} users.")
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_COLUMNS = ('username', 'email', 'password')
+
+@app.cli.command('import-users')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--credentials-out', type=click.Path(dir_okay=False),
+              help='Where to write generated passwords for rows that have none.')
+def import_users_command(csv_path, credentials_out):
+    """Create accounts in bulk from a CSV with username,email[,password] columns.
+
+    Rows whose username or email is taken (or repeated in the file), and
+    rows with more fields than the header, are skipped; other columns are
+    ignored. Rows without a password get a generated one, written to
+    --credentials-out. Users are created and provisioned IMPORT_BATCH_SIZE
+    per transaction.
+    """
+    rows, skipped = [], []
+    with open(csv_path, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in ('username', 'email') if column not in (reader.fieldnames or ())]
+        if missing:
+            raise click.UsageError(f"{csv_path} has no {' or '.join(missing)} column in its header row")
+        for row in reader:
+            # DictReader files surplus fields under the None key
+            if None in row:
+                skipped.append((reader.line_num, 'more fields than the header'))
+                continue
+            rows.append((reader.line_num, {
+                column: (row.get(column) or '').strip() for column in IMPORT_COLUMNS
+            }))
+    
+    taken_usernames, taken_emails = set(), set()
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        chunk = [row for _, row in rows[start:start + IMPORT_BATCH_SIZE]]
+        for username, email in db.session.execute(db.select(User.username, User.email).where(db.or_(
+            User.username.in_([row['username'] for row in chunk]),
+            User.email.in_([row['email'] for row in chunk])
+        ))):
+            taken_usernames.add(username)
+            taken_emails.add(email)
+    
+    accepted = []
+    for line, row in rows:
+        if not row.get('username') or not row.get('email'):
+            skipped.append((line, 'missing username or email'))
+        elif row['username'] in taken_usernames or row['email'] in taken_emails:
+            skipped.append((line, f"{row['username']} / {row['email']} already exists"))
+        else:
+            taken_usernames.add(row['username'])
+            taken_emails.add(row['email'])
+            accepted.append(row)
+    
+    generated = [row for row in accepted if not row.get('password')]
+    if generated and not credentials_out:
+        raise click.UsageError(f'{len(generated)} rows have no password; pass --credentials-out')
+    for row in generated:
+        row['password'] = secrets.token_urlsafe(12)
+    
+    # Password hashing is deliberately slow; spread it over every core
+    with ProcessPoolExecutor() as pool:
+        hashes = list(pool.map(generate_password_hash, [row['password'] for row in accepted], chunksize=32))
+    
+    for start in range(0, len(accepted), IMPORT_BATCH_SIZE):
+        chunk = accepted[start:start + IMPORT_BATCH_SIZE]
+        user_ids = db.session.execute(
+            db.insert(User).returning(User.id),
+            [{'username': row['username'], 'email': row['email'], 'password_hash': password_hash}
+             for row, password_hash in zip(chunk, hashes[start:start + IMPORT_BATCH_SIZE])]
+        ).scalars().all()
+        provision_users(user_ids)
+        db.session.commit()
+        print(f"Created {start + len(chunk)}/{len(accepted)} users")
+    
+    if generated:
+        with open(credentials_out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['username', 'email', 'password'])
+            writer.writerows((row['username'], row['email'], row['password']) for row in generated)
+        print(f"Wrote {len(generated)} generated passwords to {credentials_out}")
+    for line, reason in sorted(skipped):
+        print(f"Skipped line {line}: {reason}")
+    print(f"Imported {len(accepted)} users, skipped {len(skipped)}.")
+
+@app.cli.command('rebuild-daily-stats')
+def rebuild_daily_stats_command():
+    """Recompute every user's heatmap rollups (DailyStat) from their tasks."""
+    user_ids = db.session.execute(db.select(User.id)).scalars().all()
+    days = 0
+    for user_id in user_ids:
+        days += len(rebuild_daily_stats(user_id))
+        # Cached heatmap and stats responses would otherwise keep revalidating as 304
+        bump_data_version(user_id)
+        db.session.commit()
+    print(f"Rebuilt {days} daily rollups for {len(user_ids)} users.")
+
+@app.cli.command('reconcile-xp')
+@click.option('--dry-run', is_flag=True, help='Only report attributes and subskills whose XP has drifted.')
+def reconcile_xp_command(dry_run):
+    """Compare every current_xp column with its XP ledger and book the differences."""
+    drift = xp_drift()
+    rows = db.session.execute(db.select(drift)).all()
+    for user_id, attribute_id, subskill_id, delta in rows:
+        target = f"subskill {subskill_id}" if subskill_id is not None else f"attribute {attribute_id}"
+        print(f"user {user_id} {target}: {delta:+d} XP")
+    if not dry_run and rows:
+        reconcile_xp_ledger(db.session.connection(), 'reconcile', datetime.date.today().isoformat())
+        db.session.commit()
+    print(f"{len(rows)} drifted" + ('' if dry_run or not rows else ', reconciled') + '.')
+
+@app.cli.command('snapshot-xp')
+@click.option('--date', 'snapshot_date', help='Snapshot date (YYYY-MM-DD); defaults to yesterday.')
+def snapshot_xp_command(snapshot_date):
+    """Checkpoint every user's XP totals; run daily so history reads stay short."""
+    snapshot_date = snapshot_date or (datetime.date.today() - timedelta(days=1)).isoformat()
+    users = snapshot_xp(snapshot_date)
+    db.session.commit()
+    print(f"Stored XP snapshots for {users} users as of {snapshot_date}.")
+
+@app.cli.command('check-level-table')
+def check_level_table_command():
+    """Verify the level tables reproduce the formula curve at every boundary."""
+    mismatches = []
+    for level in range(2, MAX_TABLE_LEVEL + 1):
+        threshold = LEVEL_THRESHOLDS[level - 1]
+        for xp in (threshold - 1, threshold, threshold + 1, exp_for_level_formula(level)):
+            if calculate_level_from_exp(xp) != level_from_exp_formula(xp):
+                mismatches.append((level, xp))
+        if calculate_exp_for_level(level) != exp_for_level_formula(level):
+            mismatches.append((level, None))
+    for level, xp in mismatches:
+        print(f"FAIL level {level} at xp {xp}")
+    if mismatches:
+        raise SystemExit(1)
+    print(f"Level table matches the formula curve for levels 1-{MAX_TABLE_LEVEL}.")
+
+@app.cli.command('db-explain')
+def db_explain_command():
+    """Verify via EXPLAIN that each hot API query uses its index."""
+    failures = 0
+    with db.engine.begin() as connection:
+        for endpoint, index_name, stmt in index_plan_checks():
+            plan = explain_query(connection, stmt)
+            ok = index_name in plan
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {endpoint:<28} {index_name}")
+            if not ok:
+                print('     ' + plan.replace('\n', '\n     '))
+    if failures:
+        raise SystemExit(1)
 
 # Initialize database tables
 with app.app_context():
     db.create_all()
+    run_migrations()
 
 if __name__ == '__main__':
     app.run(debug=False, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,65 @@
+"""Gunicorn settings for the web process (see Procfile).
+
+Threaded workers (gthread): most request time is spent waiting on Postgres,
+and /api/events keeps a stream open for EVENT_STREAM_SECONDS. A sync worker
+would be tied up by a single open dashboard.
+
+Each worker runs two separate thread budgets:
+
+    GUNICORN_THREADS            request threads (default 8)
+    EVENT_STREAMS_PER_WORKER    open event streams (default 4)
+
+The stream budget is enforced in app.py. A stream beyond it is refused
+with a 503 and that tab polls instead. Gunicorn is given threads for both
+budgets, so open tabs can never take the threads that serve /api and
+/healthz. More tabs than WEB_CONCURRENCY x EVENT_STREAMS_PER_WORKER only
+shifts the extra ones to polling; raise the stream budget rather than
+GUNICORN_THREADS if live updates matter for more of them.
+
+Each worker process gets its own SQLAlchemy pool, sized in app.py from the
+same values. Idle streams release their connection between polls, so a
+stream uses one only briefly. Postgres therefore sees at most
+
+    WEB_CONCURRENCY x (GUNICORN_THREADS + EVENT_STREAMS_PER_WORKER + AI_WORKERS)
+
+connections. With the defaults (2 x (8 + 4 + 4) = 32) that stays well under
+the 100 a small Railway Postgres allows.
+
+Measured with scripts/loadtest.py: 1 vCPU container, SQLite, one worker,
+16 clients, 10s per endpoint, req/s (p95 ms):
+
+    endpoint          gthread x8      sync
+    /healthz          509 (42)        557 (33)
+    /api/stats        227 (100)       263 (73)
+    /api/tasks        200 (111)       230 (85)
+    /api/bootstrap     59 (361)        66 (285)
+
+With one /api/events stream open, /healthz answered in 3 ms under gthread.
+Under sync it waited 17 s for the stream to end. On SQLite the work is all
+CPU, so threads cost a little raw throughput. Against a networked Postgres,
+request threads overlap their round trips instead.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2, multiprocessing.cpu_count())))
+worker_class = 'gthread'
+# Request threads plus the event stream budget app.py enforces (same env vars, same defaults)
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) + int(os.environ.get('EVENT_STREAMS_PER_WORKER', 4))
+
+# gthread workers heartbeat independently of requests; this bounds a stuck worker
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so a slow leak can't grow without bound
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Not preloaded: app import creates tables, runs migrations and starts the AI
+# job threads, which must happen in each worker rather than before the fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,421 @@
+"""Per-endpoint benchmarks on a seeded SQLite database, through the Flask test client.
+
+    python scripts/bench.py --users 10 --days 30,180,365 --iterations 20
+
+Creates --users accounts in a fresh SQLite file and grows their history to
+each --days size in turn: daily tasks (plain, a numeric habit, a negative
+habit), recurring templates, quests with steps and milestones, checklist
+logs, notes and narratives, all written with bulk inserts. At every size it
+calls each /api route as the first user and prints p50/p95 latency, SQL
+statements per request and SQLite VM steps per request.
+
+VM steps stand in for rows scanned: SQLite gives Python no per-statement
+row counter, but every row a query visits costs a few steps, so a query
+that loses its index shows up as a jump in that column. Routes the suite
+cannot drive (the event stream, OpenAI calls) are listed as skipped, and
+any /api route without a benchmark is reported so the suite keeps up with
+the app.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+BENCH_PASSWORD = 'bench-password'
+DEFAULT_DAYS = '30,180,365'
+TASK_DEFAULTS = {'attribute_id': None, 'subskill_id': None, 'numeric_value': None, 'numeric_unit': None,
+                 'logged_numeric_value': None, 'negative_habit_done': None}
+VOCABULARY = ('quest', 'training', 'morning', 'focus', 'journal', 'river', 'strength', 'reading',
+              'habit', 'sleep', 'market', 'letter', 'garden', 'practice', 'review', 'evening')
+
+SKIPPED = {
+    '/api/events': 'long-lived event stream',
+    '/api/jobs/<job_id>': 'polls an AI job',
+    '/api/generate_narrative': 'calls OpenAI',
+    '/api/generate_quest': 'calls OpenAI',
+    '/api/enhance_quest_description': 'calls OpenAI',
+    '/api/test_api_key': 'calls OpenAI',
+}
+
+def load_app(db_path):
+    """Import app.py bound to db_path; the environment must be set before the import"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['AI_CACHE_PATH'] = db_path + '.ai_cache'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return importlib.import_module('app')
+
+class SqlCounter:
+    """Statements and SQLite VM steps issued through the app's engine"""
+    STEP_GRANULARITY = 100
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.vm_steps = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+        event.listen(engine, 'connect', self.on_connect)
+        # Connections pooled during the import predate the progress handler
+        engine.dispose()
+
+    def on_execute(self, *args):
+        self.statements += 1
+
+    def on_connect(self, dbapi_connection, connection_record):
+        dbapi_connection.set_progress_handler(self.on_progress, self.STEP_GRANULARITY)
+
+    def on_progress(self):
+        self.vm_steps += self.STEP_GRANULARITY
+        return 0
+
+    def reset(self):
+        self.statements = 0
+        self.vm_steps = 0
+
+# --- Seeding ---
+def words(rng, count):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(count))
+
+def seed_users(rpg, count):
+    """Create and provision `count` users; returns their ids, the benchmark user first"""
+    db = rpg.db
+    password_hash = rpg.generate_password_hash(BENCH_PASSWORD)
+    user_ids = db.session.execute(
+        db.insert(rpg.User).returning(rpg.User.id),
+        [{'username': f'bench{i}', 'email': f'bench{i}@bench.local', 'password_hash': password_hash}
+         for i in range(count)]
+    ).scalars().all()
+    rpg.provision_users(user_ids)
+    db.session.execute(db.insert(rpg.DailyChecklistItem), [
+        {'user_id': user_id, 'question': question, 'is_active': True}
+        for user_id in user_ids for question in ('Meditated?', 'Drank water?', 'In bed by 11?')
+    ])
+    db.session.execute(db.insert(rpg.RecurringTask), [
+        {'user_id': user_id, 'description': description, 'xp_value': 25, 'stress_effect': 0,
+         'is_negative_habit': False, 'start_date': '2000-01-01', 'is_active': True}
+        for user_id in user_ids for description in ('Stretch', 'Read 20 pages', 'Tidy desk')
+    ])
+    db.session.commit()
+    return sorted(user_ids)
+
+def seed_history(rpg, user_ids, first_offset, last_offset, rng):
+    """Add every user's history for the days first_offset..last_offset-1 before today"""
+    db = rpg.db
+    today = datetime.date.today()
+    targets = {}
+    for attribute_id, user_id, subskill_id in db.session.execute(
+        db.select(rpg.Attribute.attribute_id, rpg.Attribute.user_id, rpg.Subskill.subskill_id)
+        .join(rpg.Subskill, rpg.Subskill.attribute_id == rpg.Attribute.attribute_id)
+        .where(rpg.Attribute.user_id.in_(user_ids))
+    ):
+        targets.setdefault(user_id, {}).setdefault(attribute_id, []).append(subskill_id)
+    items = {}
+    for item_id, user_id in db.session.execute(
+        db.select(rpg.DailyChecklistItem.id, rpg.DailyChecklistItem.user_id)
+        .where(rpg.DailyChecklistItem.user_id.in_(user_ids))
+    ):
+        items.setdefault(user_id, []).append(item_id)
+
+    tasks, logs, narratives, notes, quests, milestones, xp_events = [], [], [], [], [], [], []
+    xp = {'attribute': {}, 'subskill': {}}
+    for user_id in user_ids:
+        for offset in range(first_offset, last_offset):
+            day = (today - datetime.timedelta(days=offset)).isoformat()
+            past = offset > 0
+            for _ in range(3):
+                attribute_id = rng.choice(list(targets[user_id]))
+                subskill_id = rng.choice(targets[user_id][attribute_id]) if rng.random() < 0.5 else None
+                reward = rng.choice(list(rpg.TASK_DIFFICULTIES.values()))
+                completed = past and rng.random() < 0.85
+                tasks.append({**TASK_DEFAULTS, 'user_id': user_id, 'date': day, 'description': words(rng, 3),
+                              'attribute_id': attribute_id, 'subskill_id': subskill_id, 'xp_gained': reward,
+                              'is_completed': completed, 'is_skipped': past and not completed and rng.random() < 0.3,
+                              'is_negative_habit': False})
+                if completed:
+                    for kind, target_id in (('attribute', attribute_id), ('subskill', subskill_id)):
+                        if target_id is not None:
+                            xp[kind][target_id] = xp[kind].get(target_id, 0) + reward
+                    xp_events.extend({'user_id': user_id, 'attribute_id': attribute_id, 'subskill_id': sub_id,
+                                      'source': 'task', 'source_id': None, 'delta': reward, 'date': day}
+                                     for sub_id in {None, subskill_id})
+            tasks.append({**TASK_DEFAULTS, 'user_id': user_id, 'date': day, 'description': 'Pushups', 'xp_gained': 25,
+                          'is_completed': past, 'is_skipped': False, 'is_negative_habit': False,
+                          'numeric_value': 20, 'numeric_unit': 'reps',
+                          'logged_numeric_value': rng.randint(0, 40) if past else None})
+            done = rng.random() < 0.3
+            tasks.append({**TASK_DEFAULTS, 'user_id': user_id, 'date': day, 'description': 'Smoking', 'xp_gained': 0,
+                          'is_completed': past, 'is_skipped': False, 'is_negative_habit': True,
+                          'numeric_value': 0, 'numeric_unit': 'occurrence',
+                          'logged_numeric_value': (1 if done else 0) if past else None,
+                          'negative_habit_done': done if past else None})
+            logs.extend({'user_id': user_id, 'item_id': item_id, 'date': day,
+                         'status': rng.choice(('completed', 'missed'))} for item_id in items[user_id])
+            if rng.random() < 0.5:
+                narratives.append({'user_id': user_id, 'date': day, 'narrative': words(rng, 80)})
+            if offset % 3 == 0:
+                notes.append({'user_id': user_id, 'title': words(rng, 3), 'content': words(rng, 120)})
+            if past and offset % 5 == 0:
+                milestones.append({'user_id': user_id, 'date': day, 'title': words(rng, 3),
+                                   'description': 'Seeded milestone', 'achievement_type': 'level'})
+            if offset % 7 == 0:
+                quests.append({'user_id': user_id, 'title': words(rng, 4), 'description': words(rng, 20),
+                               'status': 'Completed' if past else 'Active', 'difficulty': 'Medium',
+                               'xp_reward': 100, 'attribute_focus': None, 'start_date': day,
+                               'completed_date': day if past else None})
+
+    db.session.execute(db.insert(rpg.Task), tasks)
+    db.session.execute(db.insert(rpg.DailyChecklistLog), logs)
+    if narratives:
+        db.session.execute(db.insert(rpg.DailyNarrative), narratives)
+    if notes:
+        db.session.execute(db.insert(rpg.Note), notes)
+    if quests:
+        quest_ids = db.session.execute(db.insert(rpg.Quest).returning(rpg.Quest.quest_id), quests).scalars().all()
+        steps = [{'quest_id': quest_id, 'description': words(rng, 4), 'is_completed': quest['status'] == 'Completed'}
+                 for quest_id, quest in zip(quest_ids, quests) for _ in range(rng.randint(0, 5))]
+        milestones.extend({'user_id': quest['user_id'], 'date': quest['completed_date'], 'description': 'Seeded milestone',
+                           'title': f"Quest Completed: {quest['title']}", 'achievement_type': 'quest'}
+                          for quest in quests if quest['status'] == 'Completed')
+        if steps:
+            db.session.execute(db.insert(rpg.QuestStep), steps)
+    if milestones:
+        db.session.execute(db.insert(rpg.Milestone), milestones)
+
+    for table, key_column, gained in ((rpg.Attribute.__table__, 'attribute_id', xp['attribute']),
+                                      (rpg.Subskill.__table__, 'subskill_id', xp['subskill'])):
+        if gained:
+            db.session.execute(
+                table.update().where(table.c[key_column] == db.bindparam('target_id')).values(
+                    current_xp=table.c.current_xp + db.bindparam('gained')),
+                [{'target_id': target_id, 'gained': amount} for target_id, amount in gained.items()]
+            )
+    rpg.append_xp_events(xp_events)
+    for user_id in user_ids:
+        rpg.rebuild_user_counters(user_id)
+        rpg.rebuild_daily_stats(user_id)
+    db.session.commit()
+
+def table_sizes(rpg):
+    db = rpg.db
+    return {model.__tablename__: db.session.execute(db.select(db.func.count()).select_from(model)).scalar()
+            for model in (rpg.Task, rpg.XpEvent, rpg.DailyChecklistLog, rpg.Note, rpg.Quest, rpg.DailyNarrative)}
+
+# --- Requests ---
+# Each benchmark maps "METHOD /rule" to a function that does any untimed
+# setup through the client and returns the (method, url, json) to time.
+def get(url):
+    return lambda client, ctx: ('GET', url.format(**ctx), None)
+
+def new_task(client, **fields):
+    return client.post('/api/add_task', json={'description': 'Bench task', **fields}).get_json()['task_id']
+
+def new_quest(client):
+    return client.post('/api/add_quest', json={'title': 'Bench quest', 'attribute_focus': 'Wisdom'}).get_json()['quest_id']
+
+def new_step(client, ctx):
+    return client.post(f"/api/quests/{ctx['quest_id']}/steps", json={'description': 'Bench step'}).get_json()['step']['id']
+
+def new_milestone(client):
+    client.post('/api/complete_quest', json={'quest_id': new_quest(client)})
+    return client.get('/api/milestones?limit=1').get_json()['milestones'][0]['id']
+
+def new_note(client):
+    return client.post('/api/notes', json={'title': 'Bench note', 'content': 'body'}).get_json()['id']
+
+def new_checklist_item(client):
+    return client.post('/api/daily_checklist_items', json={'question': 'Bench?'}).get_json()['item']['id']
+
+def new_recurring_task(client):
+    return client.post('/api/recurring_tasks', json={'description': 'Bench recurring'}).get_json()['recurring_task_id']
+
+BENCHMARKS = {
+    'GET /api/bootstrap': get('/api/bootstrap'),
+    'GET /api/tasks': get('/api/tasks?date={mid_date}'),
+    'GET /api/stats': get('/api/stats'),
+    'GET /api/attributes': get('/api/attributes'),
+    'GET /api/attribute_history': get('/api/attribute_history?days=90'),
+    'GET /api/heatmap': get('/api/heatmap?from={year_ago}'),
+    'GET /api/habit_progress': get('/api/habit_progress?description=Pushups&bucket=week&from={year_ago}'),
+    'GET /api/get_numeric_habits': get('/api/get_numeric_habits'),
+    'GET /api/quests': get('/api/quests'),
+    'GET /api/milestones': get('/api/milestones?total=1'),
+    'GET /api/narrative': get('/api/narrative?date={mid_date}'),
+    'GET /api/narratives': get('/api/narratives?total=1'),
+    'GET /api/notes': get('/api/notes'),
+    'GET /api/notes/<int:note_id>': get('/api/notes/{note_id}'),
+    'GET /api/notes/search': get('/api/notes/search?q=garden'),
+    'GET /api/credo': get('/api/credo'),
+    'GET /api/daily_checklist_items': get('/api/daily_checklist_items'),
+    'GET /api/daily_checklist_logs': get('/api/daily_checklist_logs?date={mid_date}'),
+    'GET /api/recurring_tasks': get('/api/recurring_tasks'),
+    'GET /api/story_progress': get('/api/story_progress'),
+    'GET /api/ai_cache_stats': get('/api/ai_cache_stats'),
+    'GET /api/user_cache_stats': get('/api/user_cache_stats'),
+    'POST /api/add_task': lambda client, ctx: (
+        'POST', '/api/add_task', {'description': 'Bench task', 'attribute': 'Strength', 'subskill': 'Lifting'}),
+    'POST /api/complete_task': lambda client, ctx: (
+        'POST', '/api/complete_task', {'task_id': new_task(client, attribute='Strength', subskill='Lifting')}),
+    'POST /api/complete_negative_habit': lambda client, ctx: (
+        'POST', '/api/complete_negative_habit', {'task_id': new_task(client, is_negative_habit=True), 'did_negative': False}),
+    'POST /api/skip_task': lambda client, ctx: ('POST', '/api/skip_task', {'task_id': new_task(client)}),
+    'POST /api/delete_task': lambda client, ctx: ('POST', '/api/delete_task', {'task_id': new_task(client)}),
+    'POST /api/batch': lambda client, ctx: ('POST', '/api/batch', {'operations': [
+        {'op': 'complete_task', 'task_id': new_task(client, attribute='Wisdom')} for _ in range(10)
+    ]}),
+    'POST /api/reset_day': lambda client, ctx: ('POST', '/api/reset_day', {'date': ctx['reset_dates'].pop()}),
+    'POST /api/add_quest': lambda client, ctx: ('POST', '/api/add_quest', {'title': 'Bench quest'}),
+    'PUT /api/quests/<int:quest_id>': lambda client, ctx: (
+        'PUT', f"/api/quests/{ctx['quest_id']}", {'title': 'Renamed bench quest'}),
+    'POST /api/complete_quest': lambda client, ctx: ('POST', '/api/complete_quest', {'quest_id': new_quest(client)}),
+    'POST /api/quests/<int:quest_id>/steps': lambda client, ctx: (
+        'POST', f"/api/quests/{ctx['quest_id']}/steps", {'description': 'Bench step'}),
+    'PUT /api/quest_steps/<int:step_id>/toggle': lambda client, ctx: (
+        'PUT', f"/api/quest_steps/{new_step(client, ctx)}/toggle", None),
+    'DELETE /api/quest_steps/<int:step_id>': lambda client, ctx: (
+        'DELETE', f"/api/quest_steps/{new_step(client, ctx)}", None),
+    'POST /api/delete_milestone': lambda client, ctx: (
+        'POST', '/api/delete_milestone', {'milestone_id': new_milestone(client)}),
+    'POST /api/credo': lambda client, ctx: ('POST', '/api/credo', {'content': 'Bench credo'}),
+    'POST /api/notes': lambda client, ctx: ('POST', '/api/notes', {'title': 'Bench note', 'content': 'body'}),
+    'PUT /api/notes/<int:note_id>': lambda client, ctx: (
+        'PUT', f"/api/notes/{ctx['note_id']}", {'content': 'Edited bench note'}),
+    'DELETE /api/notes/<int:note_id>': lambda client, ctx: ('DELETE', f"/api/notes/{new_note(client)}", None),
+    'POST /api/daily_checklist_items': lambda client, ctx: (
+        'POST', '/api/daily_checklist_items', {'question': 'Bench?'}),
+    'DELETE /api/daily_checklist_items/<int:item_id>': lambda client, ctx: (
+        'DELETE', f"/api/daily_checklist_items/{new_checklist_item(client)}", None),
+    'POST /api/daily_checklist_logs': lambda client, ctx: ('POST', '/api/daily_checklist_logs', {
+        'item_id': ctx['item_id'], 'date': ctx['today'], 'status': random.choice(('completed', 'missed'))}),
+    'POST /api/recurring_tasks': lambda client, ctx: (
+        'POST', '/api/recurring_tasks', {'description': 'Bench recurring'}),
+    'POST /api/recurring_tasks/<int:rt_id>/toggle_active': lambda client, ctx: (
+        'POST', f"/api/recurring_tasks/{ctx['recurring_task_id']}/toggle_active", None),
+    'DELETE /api/recurring_tasks/<int:rt_id>': lambda client, ctx: (
+        'DELETE', f"/api/recurring_tasks/{new_recurring_task(client)}", None),
+}
+
+def unbenchmarked_routes(app):
+    """'METHOD /rule' for every /api route with neither a benchmark nor a reason to skip it"""
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if not rule.rule.startswith('/api/') or rule.rule in SKIPPED:
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if f'{method} {rule.rule}' not in BENCHMARKS:
+                missing.append(f'{method} {rule.rule}')
+    return sorted(missing)
+
+def request_context(rpg, user_id, iterations):
+    """Ids and dates the benchmarks fill into their URLs and bodies"""
+    db = rpg.db
+    today = datetime.date.today()
+    first = lambda model, *criteria: db.session.execute(
+        db.select(model).where(*criteria).limit(1)).scalar()
+    oldest = db.session.execute(db.select(db.func.min(rpg.Task.date)).where(rpg.Task.user_id == user_id)).scalar()
+    span = (today - datetime.date.fromisoformat(oldest)).days
+    return {
+        'today': today.isoformat(),
+        'mid_date': (today - datetime.timedelta(days=span // 2)).isoformat(),
+        'year_ago': (today - datetime.timedelta(days=364)).isoformat(),
+        'note_id': first(rpg.Note.id, rpg.Note.user_id == user_id),
+        'quest_id': first(rpg.Quest.quest_id, rpg.Quest.user_id == user_id),
+        'item_id': first(rpg.DailyChecklistItem.id, rpg.DailyChecklistItem.user_id == user_id),
+        'recurring_task_id': first(rpg.RecurringTask.recurring_task_id, rpg.RecurringTask.user_id == user_id),
+        # reset_day consumes the oldest seeded days, one per call
+        'reset_dates': [(today - datetime.timedelta(days=span - i)).isoformat() for i in range(iterations + 1)][::-1],
+    }
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+def run_benchmark(client, counter, prepare, ctx, iterations):
+    latencies, statements, vm_steps, errors = [], [], [], 0
+    # The first call warms per-process caches and is not counted
+    for i in range(iterations + 1):
+        try:
+            method, url, body = prepare(client, ctx)
+        except (IndexError, KeyError, TypeError):
+            errors += 1
+            continue
+        counter.reset()
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        elapsed = time.perf_counter() - start
+        errors += response.status_code >= 400
+        if i:
+            latencies.append(elapsed)
+            statements.append(counter.statements)
+            vm_steps.append(counter.vm_steps)
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'queries': statistics.median(statements) if statements else None,
+        'vm_steps': statistics.median(vm_steps) if vm_steps else None,
+        'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--days', default=DEFAULT_DAYS, help='Comma-separated history sizes, in days, to measure at')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file')
+    args = parser.parse_args()
+    sizes = sorted(int(days) for days in args.days.split(','))
+
+    workdir = tempfile.mkdtemp(prefix='life-rpg-bench-')
+    try:
+        rpg = load_app(os.path.join(workdir, 'bench.db'))
+        rng = random.Random(args.seed)
+        with rpg.app.app_context():
+            counter = SqlCounter(rpg.db.engine)
+            user_ids = seed_users(rpg, args.users)
+
+        client = rpg.app.test_client()
+        client.post('/login', json={'username': 'bench0', 'password': BENCH_PASSWORD})
+        benchmarks = {name: prepare for name, prepare in BENCHMARKS.items()
+                      if not args.only or args.only in name}
+
+        results, seeded = {}, 0
+        for days in sizes:
+            with rpg.app.app_context():
+                seed_started = time.perf_counter()
+                seed_history(rpg, user_ids, seeded, days, rng)
+                seed_seconds = time.perf_counter() - seed_started
+                sizes_now = table_sizes(rpg)
+                ctx = request_context(rpg, user_ids[0], args.iterations)
+            seeded = days
+
+            print(f"\n== {args.users} users x {days} days (seeded in {seed_seconds:.1f}s): "
+                  + ', '.join(f'{name} {count}' for name, count in sizes_now.items()))
+            print(f"{'endpoint':<52} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'vm steps':>10} {'errors':>7}")
+            results[days] = {'tables': sizes_now, 'endpoints': {}}
+            for name, prepare in benchmarks.items():
+                row = run_benchmark(client, counter, prepare, ctx, args.iterations)
+                results[days]['endpoints'][name] = row
+                print(f"{name:<52} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['queries'] or 0:>8g} "
+                      f"{row['vm_steps'] or 0:>10g} {row['errors']:>7}")
+
+        print()
+        for route, reason in SKIPPED.items():
+            print(f"skipped {route}: {reason}")
+        for name in unbenchmarked_routes(rpg.app):
+            print(f"NOT BENCHMARKED {name}")
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
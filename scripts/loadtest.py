@@ -0,0 +1,82 @@
+"""Concurrent GET load against a running Life RPG server.
+
+    python scripts/loadtest.py --url http://localhost:8000 --clients 16 --seconds 20
+
+Registers (or logs in) one user, then hammers each endpoint in turn from
+--clients threads, each with its own session, and prints requests/second
+and latency percentiles. Standard library only, so it runs anywhere the
+server does.
+"""
+import argparse
+import http.cookiejar
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_ENDPOINTS = ('/healthz', '/api/stats', '/api/tasks', '/api/bootstrap')
+
+def session(base_url, username, password):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    credentials = {'username': username, 'email': f'{username}@loadtest.local', 'password': password}
+    for path in ('/register', '/login'):
+        request = urllib.request.Request(
+            base_url + path, data=json.dumps(credentials).encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            if json.load(opener.open(request)).get('success'):
+                return opener
+        except urllib.error.HTTPError:
+            pass
+    raise SystemExit(f'Could not register or log in as {username}')
+
+def run_endpoint(openers, url, seconds):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(opener):
+        nonlocal errors
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                opener.open(url).read()
+                local.append(time.perf_counter() - start)
+            except (urllib.error.URLError, ConnectionError):
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    threads = [threading.Thread(target=client, args=(opener,)) for opener in openers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--user', default='loadtest')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('endpoints', nargs='*', default=DEFAULT_ENDPOINTS)
+    args = parser.parse_args()
+
+    openers = [session(args.url, args.user, args.password) for _ in range(args.clients)]
+    print(f"{'endpoint':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for endpoint in args.endpoints:
+        latencies, errors = run_endpoint(openers, args.url + endpoint, args.seconds)
+        print(f"{endpoint:<20} {len(latencies) / args.seconds:>8.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} {errors:>7}")
+
+if __name__ == '__main__':
+    main()
@@ -5,12 +5,16 @@ let tasks = [];
 let recurringTasks = [];
 let characterStats = {};
 let quests = [];
-let milestones = { data: [], page: 1, totalPages: 1, perPage: 5 };
-let narratives = { data: [], page: 1, totalPages: 1, perPage: 3 };
+// History lists page by cursor; cursors[n - 1] fetches page n
+let milestones = { data: [], page: 1, cursors: [null], hasNext: false, perPage: 5 };
+let narratives = { data: [], page: 1, cursors: [null], hasNext: false, perPage: 3 };
 let heatmapCurrentDate = new Date(); // For heatmap navigation
+let heatmapData = [];
 
 // NEW: Global variables for new features
 let notes = [];
+let noteSearchResults = null; // Search hits while the notes search box has a query
+let noteSearchTimer = null;
 let dailyChecklistItems = [];
 let dailyChecklistLogs = [];
 let currentChecklistDate = new Date().toISOString().split('T')[0];
@@ -22,6 +26,7 @@ document.addEventListener('DOMContentLoaded', () => {
     document.getElementById('checklist-date').value = currentChecklistDate;
     initializePageData();
     setupEventListeners();
+    connectEventStream();
 });
 
 function checkAPIKey() {
@@ -79,22 +84,48 @@ function skipApiKey() {
 async function initializePageData() {
     console.log("Initializing all page data...");
     
-    await fetchAndRenderAttributes();
+    // One request for the whole dashboard; the fetchAndRender* helpers below
+    // are still used to refresh individual panels after an action
+    const year = heatmapCurrentDate.getFullYear();
+    const month = heatmapCurrentDate.getMonth() + 1;
+    const params = new URLSearchParams({
+        date: currentSelectedDate,
+        checklist_date: currentChecklistDate,
+        year,
+        month,
+        milestones_cursor: milestones.cursors[milestones.page - 1] || '',
+        milestones_limit: milestones.perPage,
+        narratives_cursor: narratives.cursors[narratives.page - 1] || '',
+        narratives_limit: narratives.perPage
+    });
+    const data = await apiCall(`/api/bootstrap?${params}`);
+    if (!data) return;
     
-    await fetchAndRenderTasks(currentSelectedDate);
-    await fetchAndRenderStats();
-    await fetchAndRenderRecurringTasks();
-    await fetchAndRenderQuests();
-    await fetchAndRenderMilestones(milestones.page);
-    await fetchAndRenderDailyNarrative(currentSelectedDate);
-    await fetchAndRenderNarrativeHistory(narratives.page);
-    await fetchAndRenderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1);
-    await fetchAndRenderHabitProgressor();
+    attributes = data.attributes;
+    renderAttributes();
+    populateAttributeDropdowns();
     
-    // NEW: Initialize new features
-    await fetchAndRenderCredo();
-    await fetchAndRenderNotes();
-    await fetchAndRenderDailyChecklist(currentChecklistDate);
+    tasks = data.tasks;
+    renderTasks();
+    characterStats = data.stats;
+    renderCharacterStats();
+    recurringTasks = data.recurring_tasks;
+    renderRecurringTasks();
+    quests = data.quests;
+    renderQuests();
+    applyMilestonesPage(data.milestones, milestones.page);
+    renderDailyNarrative(data.narrative.narrative);
+    applyNarrativesPage(data.narratives, narratives.page);
+    heatmapData = data.heatmap;
+    renderHeatmap(year, month, heatmapData);
+    populateHabitProgressDropdown(data.numeric_habits, document.getElementById('habit-progress-select').value);
+    
+    document.getElementById('credo-content').value = data.credo.content;
+    notes = data.notes;
+    renderNotes();
+    dailyChecklistItems = data.checklist_items;
+    dailyChecklistLogs = data.checklist_logs;
+    renderDailyChecklist();
     
     updateHeatmapControlsLabel();
 }
@@ -148,6 +179,7 @@ function setupEventListeners() {
         openModal('addNoteModal');
     });
     document.getElementById('add-note-form').addEventListener('submit', handleAddNote);
+    document.getElementById('notes-search').addEventListener('input', handleNoteSearchInput);
     document.getElementById('checklist-date').addEventListener('change', handleChecklistDateChange);
     document.getElementById('add-checklist-item-btn').addEventListener('click', () => openModal('addChecklistItemModal'));
     document.getElementById('add-checklist-item-form').addEventListener('submit', handleAddChecklistItem);
@@ -177,10 +209,7 @@ async function handleAddTask(event) {
         form.reset();
         setupRadioGroup('task-type-radio', 'task-difficulty-group', 'task-stress', 'task-stress-value-display', 'task-numeric-inputs');
         closeModal('addTaskModal');
-        await fetchAndRenderTasks(currentSelectedDate);
-        if (!payload.is_negative_habit && payload.attribute) await fetchAndRenderAttributes();
-        await fetchAndRenderStats();
-        await fetchAndRenderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1);
+        applyEvents(result.events);
         await fetchAndRenderHabitProgressor();
     }
 }
@@ -226,8 +255,7 @@ async function handleAddQuest(event) {
     if (result && result.success) {
         form.reset();
         closeModal('addQuestModal');
-        await fetchAndRenderQuests();
-        await fetchAndRenderStats();
+        applyEvents(result.events);
     }
 }
 
@@ -271,7 +299,7 @@ async function handleAddChecklistItem(event) {
 
 // Update editNote function to use modal
 async function editNote(noteId) {
-    const note = notes.find(n => n.id === noteId);
+    const note = await fetchNote(noteId);
     if (!note) return;
     
     document.getElementById('note-form-title').textContent = 'Edit Note';
@@ -356,17 +384,13 @@ async function enhanceQuestDescription() {
 }
 
 async function completeNegativeHabit(taskId, didNegative) {
-    const result = await apiCall('/api/complete_negative_habit', 'POST', { 
+    const result = await queueOperation({ 
+        op: 'complete_negative_habit',
         task_id: taskId, 
         did_negative: didNegative 
     });
     
     if (result && result.success) {
-        await fetchAndRenderTasks(currentSelectedDate);
-        await fetchAndRenderAttributes();
-        await fetchAndRenderStats();
-        await fetchAndRenderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1);
-        
         const message = didNegative ? 
             "Habit tracked. Don't worry, tomorrow is a new opportunity!" : 
             "Great job avoiding that habit! You earned bonus XP!";
@@ -382,11 +406,7 @@ async function completeNegativeHabit(taskId, didNegative) {
 async function skipTask(taskId) {
     if (!confirm('Mark this task as skipped? It will not count towards your progress.')) return;
     
-    const result = await apiCall('/api/skip_task', 'POST', { task_id: taskId });
-    if (result && result.success) {
-        await fetchAndRenderTasks(currentSelectedDate);
-        await fetchAndRenderStats();
-    }
+    await queueOperation({ op: 'skip_task', task_id: taskId });
 }
 
 async function handleDateChange(e) {
@@ -472,12 +492,8 @@ async function completeTask(taskId, isNumeric = false, unit = '', forcedValue =
         payload.logged_numeric_value = parseFloat(loggedValue);
     }
 
-    const result = await apiCall('/api/complete_task', 'POST', payload);
+    const result = await queueOperation({ op: 'complete_task', ...payload });
     if (result && result.success) {
-        await fetchAndRenderTasks(currentSelectedDate);
-        await fetchAndRenderAttributes();
-        await fetchAndRenderStats();
-        await fetchAndRenderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1);
         if (isNumeric) await fetchAndRenderHabitProgressor(true);
         
         if (Math.random() < 0.2) {
@@ -492,13 +508,7 @@ async function deleteTask(taskId) {
     if (!confirm('Are you sure you want to delete this task?')) return;
     const result = await apiCall('/api/delete_task', 'POST', { task_id: taskId });
     if (result && result.success) {
-        await fetchAndRenderTasks(currentSelectedDate);
-        const deletedTask = tasks.find(t => t.id === taskId);
-        if (deletedTask && deletedTask.completed && !deletedTask.is_negative_habit) {
-            await fetchAndRenderAttributes();
-        }
-        await fetchAndRenderStats();
-        await fetchAndRenderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1);
+        applyEvents(result.events);
         await fetchAndRenderHabitProgressor();
     }
 }
@@ -524,11 +534,7 @@ async function completeQuest(questId) {
     if (!confirm('Mark this quest as completed?')) return;
     const result = await apiCall('/api/complete_quest', 'POST', { quest_id: questId });
     if (result && result.success) {
-        await fetchAndRenderQuests();
-        await fetchAndRenderAttributes();
-        await fetchAndRenderStats();
-        await fetchAndRenderMilestones(milestones.page);
-        await fetchAndRenderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1);
+        applyEvents(result.events);
     }
 }
 
@@ -592,7 +598,7 @@ async function handleSaveQuestChanges() {
     const result = await apiCall(`/api/quests/${questId}`, 'PUT', payload);
     if (result && result.success) {
         closeEditQuestModal();
-        await fetchAndRenderQuests();
+        applyEvents(result.events);
     }
 }
 
@@ -607,13 +613,10 @@ async function handleAddQuestStep(event) {
     const result = await apiCall(`/api/quests/${questId}/steps`, 'POST', { description });
     if (result && result.success) {
         descriptionInput.value = '';
-        // Manually update local quest object and re-render modal checklist
+        // The quest delta carries the new step; re-render the modal checklist from it
+        applyEvents(result.events);
         const quest = quests.find(q => q.id === parseInt(questId));
-        if (quest) {
-            quest.steps.push(result.step);
-            renderQuestChecklistInModal(quest);
-            await fetchAndRenderQuests(); // Also update the main view
-        }
+        if (quest) renderQuestChecklistInModal(quest);
     }
 }
 
@@ -621,13 +624,9 @@ async function toggleQuestStep(stepId) {
     const result = await apiCall(`/api/quest_steps/${stepId}/toggle`, 'PUT');
     if (result && result.success) {
         // Update local state and re-render
+        applyEvents(result.events);
         const quest = quests.find(q => q.steps.some(s => s.id === stepId));
-        if(quest) {
-            const step = quest.steps.find(s => s.id === stepId);
-            step.is_completed = result.is_completed;
-            renderQuestChecklistInModal(quest); // Re-render modal if open
-            await fetchAndRenderQuests(); // Re-render main quest list
-        }
+        if (quest) renderQuestChecklistInModal(quest); // Re-render modal if open
     }
 }
 
@@ -635,12 +634,9 @@ async function deleteQuestStep(stepId, questId) {
     if (!confirm('Are you sure you want to delete this step?')) return;
     const result = await apiCall(`/api/quest_steps/${stepId}`, 'DELETE');
     if (result && result.success) {
+        applyEvents(result.events);
         const quest = quests.find(q => q.id === questId);
-        if (quest) {
-            quest.steps = quest.steps.filter(s => s.id !== stepId);
-            renderQuestChecklistInModal(quest);
-            await fetchAndRenderQuests();
-        }
+        if (quest) renderQuestChecklistInModal(quest);
     }
 }
 
@@ -663,6 +659,29 @@ async function handleSaveCredo() {
 // --- NEW: Notes Functions ---
 async function fetchAndRenderNotes() {
     notes = await apiCall('/api/notes') || [];
+    await runNoteSearch();
+}
+
+// Notes in the list carry a preview only; the body is fetched when a note is opened
+async function fetchNote(noteId) {
+    return await apiCall(`/api/notes/${noteId}`);
+}
+
+function handleNoteSearchInput() {
+    clearTimeout(noteSearchTimer);
+    noteSearchTimer = setTimeout(runNoteSearch, 250);
+}
+
+async function runNoteSearch() {
+    const query = document.getElementById('notes-search').value.trim();
+    if (!query) {
+        noteSearchResults = null;
+    } else {
+        const data = await apiCall(`/api/notes/search?q=${encodeURIComponent(query)}`);
+        // Ignore responses for a query the user has already typed past
+        if (!data || data.query !== document.getElementById('notes-search').value.trim()) return;
+        noteSearchResults = data.results;
+    }
     renderNotes();
 }
 
@@ -670,25 +689,30 @@ function renderNotes() {
     const container = document.getElementById('notes-container');
     container.innerHTML = '';
     
-    if (notes.length === 0) {
+    if (noteSearchResults !== null) {
+        if (noteSearchResults.length === 0) {
+            container.innerHTML = '<p>No notes match your search.</p>';
+            return;
+        }
+    } else if (notes.length === 0) {
         container.innerHTML = '<p>No notes yet. Click "Add Note" to create your first note.</p>';
         return;
     }
     
-    notes.forEach(note => {
+    (noteSearchResults || notes).forEach(note => {
         const noteEl = document.createElement('div');
         noteEl.className = 'note-item';
         // The onclick for viewing the full note
         noteEl.setAttribute('onclick', `viewNote(${note.id})`);
         noteEl.innerHTML = `
             <div class="note-header">
-                <h4 class="note-title">${note.title}</h4>
+                <h4 class="note-title">${note.title_html || note.title}</h4>
                 <div class="note-actions">
                     <button onclick="event.stopPropagation(); editNote(${note.id})" class="btn-secondary btn-small">✏️ Edit</button>
                     <button onclick="event.stopPropagation(); deleteNote(${note.id})" class="btn-danger btn-small">🗑️ Delete</button>
                 </div>
             </div>
-            <div class="note-content-preview">${note.content.substring(0, 150)}${note.content.length > 150 ? '...' : ''}</div>
+            <div class="note-content-preview">${note.snippet_html !== undefined ? note.snippet_html : note.preview}</div>
             <div class="note-meta">Updated: ${note.updated_at}</div>
         `;
         container.appendChild(noteEl);
@@ -713,8 +737,8 @@ async function deleteNote(noteId) {
 }
 
 // --- NEW: View Note Functionality ---
-function viewNote(noteId) {
-    const note = notes.find(n => n.id === noteId);
+async function viewNote(noteId) {
+    const note = await fetchNote(noteId);
     if (!note) return;
     document.getElementById('view-note-title').textContent = note.title;
     document.getElementById('view-note-content-container').innerHTML = note.content.replace(/\n/g, '<br>');
@@ -766,14 +790,13 @@ async function handleChecklistDateChange(event) {
 }
 
 async function logChecklistItem(itemId, status) {
-    const result = await apiCall('/api/daily_checklist_logs', 'POST', {
-        item_id: itemId,
-        date: currentChecklistDate,
-        status: status
-    });
+    const date = currentChecklistDate;
+    const result = await queueOperation({ op: 'log_checklist_item', item_id: itemId, date, status });
     
-    if (result && result.success) {
-        await fetchAndRenderDailyChecklist(currentChecklistDate);
+    if (result && result.success && date === currentChecklistDate) {
+        const log = dailyChecklistLogs.find(l => l.id === itemId);
+        if (log) log.status = result.status;
+        renderDailyChecklist();
     }
 }
 
@@ -787,6 +810,55 @@ async function deleteChecklistItem(itemId) {
 }
 
 // --- API and Utility Functions ---
+// --- Batched Mutations ---
+// Completions, skips and checklist answers made in quick succession are sent
+// together to /api/batch: one request and one commit for the whole burst.
+const BATCH_DELAY_MS = 150;
+const BATCH_MAX_OPERATIONS = 100; // the server's per-request limit
+let pendingOperations = [];
+let batchTimer = null;
+
+function queueOperation(op) {
+    return new Promise(resolve => {
+        pendingOperations.push({ op, resolve });
+        clearTimeout(batchTimer);
+        batchTimer = setTimeout(flushOperations, BATCH_DELAY_MS);
+    });
+}
+
+async function flushOperations() {
+    // A longer burst goes out in several batches, one after another
+    const queued = pendingOperations.splice(0, BATCH_MAX_OPERATIONS);
+    if (queued.length === 0) return;
+    let data = null;
+    try {
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ operations: queued.map(q => q.op) })
+        });
+        data = await response.json();
+    } catch (error) {
+        console.error('Fetch API Error:', error, 'Endpoint: /api/batch');
+    }
+
+    if (data && data.success) {
+        applyEvents(data.events);
+        queued.forEach((q, i) => q.resolve(data.results[i]));
+    } else if (data && data.failed_index !== undefined) {
+        // The batch was rolled back: report the failing operation and resend the rest
+        alert(`Error: ${data.error}`);
+        queued[data.failed_index].resolve({ success: false, error: data.error });
+        queued.splice(data.failed_index, 1);
+        pendingOperations = queued.concat(pendingOperations);
+        await flushOperations();
+    } else {
+        alert('A network or unexpected error occurred. Please check the console.');
+        queued.forEach(q => q.resolve(null));
+    }
+    if (pendingOperations.length > 0) await flushOperations();
+}
+
 async function apiCall(endpoint, method = 'GET', body = null) {
     const options = { method, headers: {} };
     if (body) {
@@ -835,15 +907,33 @@ async function fetchAndRenderQuests() {
     renderQuests();
 }
 
+function pageQuery(pageData, page) {
+    const params = new URLSearchParams({ limit: pageData.perPage });
+    const cursor = pageData.cursors[page - 1];
+    if (cursor) params.set('cursor', cursor);
+    return params;
+}
+
+function applyCursorPage(pageData, items, nextCursor, page) {
+    pageData.data = items;
+    pageData.page = page;
+    pageData.hasNext = !!nextCursor;
+    pageData.cursors.length = page;
+    if (nextCursor) pageData.cursors.push(nextCursor);
+}
+
 async function fetchAndRenderMilestones(page) {
-    const data = await apiCall(`/api/milestones?page=${page}&per_page=${milestones.perPage}`);
-    if (data) {
-        milestones.data = data.milestones;
-        milestones.page = data.current_page;
-        milestones.totalPages = data.pages;
-        renderMilestones();
-        renderPagination('milestones-pagination', 'milestones-pagination-info', milestones, fetchAndRenderMilestones);
-    }
+    const data = await apiCall(`/api/milestones?${pageQuery(milestones, page)}`);
+    if (!data) return;
+    // The page emptied out (e.g. its last item was deleted): step back one
+    if (data.milestones.length === 0 && page > 1) return fetchAndRenderMilestones(page - 1);
+    applyMilestonesPage(data, page);
+}
+
+function applyMilestonesPage(data, page) {
+    applyCursorPage(milestones, data.milestones, data.next_cursor, page);
+    renderMilestones();
+    renderPagination('milestones-pagination', 'milestones-pagination-info', milestones, fetchAndRenderMilestones);
 }
 
 async function fetchAndRenderDailyNarrative(date, forceRegenerate = false) {
@@ -851,7 +941,10 @@ async function fetchAndRenderDailyNarrative(date, forceRegenerate = false) {
     let data;
     
     if (forceRegenerate && apiKey) {
-        data = await apiCall('/api/generate_narrative', 'POST', { date, api_key: apiKey });
+        renderDailyNarrative('The storyteller is writing today\'s entry...');
+        const job = await apiCall('/api/generate_narrative', 'POST', { date, api_key: apiKey });
+        data = job ? await waitForJob(job) : null;
+        if (!data) data = await apiCall(`/api/narrative?date=${date}`);
     } else {
         data = await apiCall(`/api/narrative?date=${date}`);
     }
@@ -864,22 +957,171 @@ async function fetchAndRenderDailyNarrative(date, forceRegenerate = false) {
     }
 }
 
-async function fetchAndRenderNarrativeHistory(page) {
-    const data = await apiCall(`/api/narratives?page=${page}&per_page=${narratives.perPage}`);
-    if (data) {
-        narratives.data = data.narratives;
-        narratives.page = data.current_page;
-        narratives.totalPages = data.pages;
-        renderNarrativeHistory();
-        renderPagination('narratives-pagination', 'narratives-pagination-info', narratives, fetchAndRenderNarrativeHistory);
+// Polls a background job until it finishes; resolves to its result (null on failure).
+// The server fails jobs left unfinished for 5 minutes; the deadline is a backstop.
+const JOB_WAIT_MS = 6 * 60 * 1000;
+
+async function waitForJob(job, intervalMs = 1500) {
+    const deadline = Date.now() + JOB_WAIT_MS;
+    while (job && (job.status === 'queued' || job.status === 'running')) {
+        if (Date.now() > deadline) {
+            alert('Error: The request is taking too long. Please try again.');
+            return null;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        job = await apiCall(`/api/jobs/${job.job_id}`);
+    }
+    if (job && job.status === 'error') {
+        alert(`Error: ${job.error}`);
+        return null;
     }
+    return job ? job.result : null;
+}
+
+async function fetchAndRenderNarrativeHistory(page) {
+    const data = await apiCall(`/api/narratives?${pageQuery(narratives, page)}`);
+    if (!data) return;
+    if (data.narratives.length === 0 && page > 1) return fetchAndRenderNarrativeHistory(page - 1);
+    applyNarrativesPage(data, page);
+}
+
+function applyNarrativesPage(data, page) {
+    applyCursorPage(narratives, data.narratives, data.next_cursor, page);
+    renderNarrativeHistory();
+    renderPagination('narratives-pagination', 'narratives-pagination-info', narratives, fetchAndRenderNarrativeHistory);
 }
 
 async function fetchAndRenderHeatmap(year, month) {
     const data = await apiCall(`/api/heatmap?year=${year}&month=${month}`);
     if (data) {
-        renderHeatmap(year, month, data);
+        heatmapData = data;
+        renderHeatmap(year, month, heatmapData);
+    }
+}
+
+// --- Live Updates ---
+// Mutations return the deltas they produced in result.events, and the same
+// deltas arrive over /api/events for changes made in other tabs. Applying one
+// twice is harmless: every patch replaces the item by id.
+// When the server has no stream to spare (503) or EventSource is missing, the
+// live panels are polled instead; unchanged ones revalidate as 304s.
+const EVENT_STREAM_RETRY_MS = 60000;
+const LIVE_POLL_MS = 20000;
+let livePollTimer = null;
+
+function connectEventStream() {
+    if (!window.EventSource) {
+        startLivePolling();
+        return;
     }
+    const source = new EventSource('/api/events');
+    source.onopen = stopLivePolling;
+    source.onmessage = (e) => applyEvents([JSON.parse(e.data)]);
+    source.onerror = () => {
+        // CONNECTING means the browser is already reconnecting; CLOSED means it gave up
+        if (source.readyState !== EventSource.CLOSED) return;
+        startLivePolling();
+        setTimeout(connectEventStream, EVENT_STREAM_RETRY_MS);
+    };
+}
+
+function startLivePolling() {
+    if (livePollTimer === null) livePollTimer = setInterval(pollLivePanels, LIVE_POLL_MS);
+}
+
+function stopLivePolling() {
+    clearInterval(livePollTimer);
+    livePollTimer = null;
+}
+
+async function pollLivePanels() {
+    if (document.hidden) return;
+    const date = currentSelectedDate;
+    // Quiet fetches: a missed poll is simply retried on the next tick
+    const quietFetch = endpoint => fetch(endpoint)
+        .then(response => response.ok ? response.json() : null)
+        .catch(() => null);
+    const [polledTasks, polledAttributes, polledStats, polledQuests] = await Promise.all([
+        quietFetch(`/api/tasks?date=${date}`),
+        quietFetch('/api/attributes'),
+        quietFetch('/api/stats'),
+        quietFetch('/api/quests')
+    ]);
+    if (polledTasks && date === currentSelectedDate) { tasks = polledTasks; renderTasks(); }
+    if (polledAttributes) { attributes = polledAttributes; renderAttributes(); }
+    if (polledStats) { characterStats = polledStats; renderCharacterStats(); }
+    if (polledQuests) { quests = polledQuests; renderQuests(); }
+}
+
+function upsertById(list, item) {
+    const index = list.findIndex(existing => existing.id === item.id);
+    if (index === -1) list.push(item);
+    else list[index] = item;
+}
+
+function sortTasks() {
+    // Same order as /api/tasks: open, then completed, then skipped, alphabetical within each
+    tasks.sort((a, b) => (a.completed - b.completed) || (a.skipped - b.skipped) || a.description.localeCompare(b.description));
+}
+
+function sortQuests() {
+    // Same order as /api/quests: active first, then by due date (undated last), newest start first
+    const dueKey = q => q.due_date || '9999-12-31';
+    quests.sort((a, b) => ((b.status === 'Active') - (a.status === 'Active'))
+        || dueKey(a).localeCompare(dueKey(b))
+        || (b.start_date || '').localeCompare(a.start_date || ''));
+}
+
+function applyEvents(events) {
+    if (!events || events.length === 0) return;
+    const dirty = new Set();
+
+    events.forEach(event => {
+        switch (event.type) {
+            case 'task':
+                if (event.date !== currentSelectedDate) break;
+                upsertById(tasks, event.task);
+                sortTasks();
+                dirty.add('tasks');
+                break;
+            case 'task_deleted':
+                if (event.date !== currentSelectedDate) break;
+                tasks = tasks.filter(t => t.id !== event.task_id);
+                dirty.add('tasks');
+                break;
+            case 'attribute':
+                upsertById(attributes, event.attribute);
+                dirty.add('attributes');
+                break;
+            case 'stats':
+                characterStats = event.stats;
+                dirty.add('stats');
+                break;
+            case 'quest':
+                upsertById(quests, event.quest);
+                sortQuests();
+                dirty.add('quests');
+                break;
+            case 'daily_stat': {
+                const [year, month] = event.date.split('-').map(Number);
+                if (year !== heatmapCurrentDate.getFullYear() || month !== heatmapCurrentDate.getMonth() + 1) break;
+                heatmapData = heatmapData.filter(d => d.date !== event.date);
+                heatmapData.push({ date: event.date, count: event.count, xp: event.xp });
+                dirty.add('heatmap');
+                break;
+            }
+            case 'milestones':
+                dirty.add('milestones');
+                break;
+        }
+    });
+
+    if (dirty.has('tasks')) renderTasks();
+    if (dirty.has('attributes')) renderAttributes();
+    if (dirty.has('stats')) renderCharacterStats();
+    if (dirty.has('quests')) renderQuests();
+    if (dirty.has('heatmap')) renderHeatmap(heatmapCurrentDate.getFullYear(), heatmapCurrentDate.getMonth() + 1, heatmapData);
+    if (dirty.has('milestones')) fetchAndRenderMilestones(milestones.page);
 }
 
 async function fetchAndRenderHabitProgressor(refreshCurrent = false) {
@@ -1137,8 +1379,8 @@ function createQuestCard(quest) {
         dueStatus = 'No due date';
     }
 
-    const completedSteps = quest.steps.filter(s => s.is_completed).length;
-    const totalSteps = quest.steps.length;
+    const completedSteps = quest.steps_completed;
+    const totalSteps = quest.step_count;
 
     // NEW: Quest card structure with checklist
     card.innerHTML = `
@@ -1403,7 +1645,7 @@ function renderPagination(containerId, infoContainerId, pageDataObject, fetchCal
     container.innerHTML = '';
     if (infoContainer) infoContainer.innerHTML = '';
 
-    if (!pageDataObject || pageDataObject.totalPages <= 1) return;
+    if (!pageDataObject || (pageDataObject.page === 1 && !pageDataObject.hasNext)) return;
 
     if (pageDataObject.page > 1) {
         const prevBtn = document.createElement('button');
@@ -1414,18 +1656,17 @@ function renderPagination(containerId, infoContainerId, pageDataObject, fetchCal
     }
     
     const pageNumSpan = document.createElement('span');
-    pageNumSpan.textContent = ` Page ${pageDataObject.page} of ${pageDataObject.totalPages} `;
+    pageNumSpan.textContent = ` Page ${pageDataObject.page} `;
     pageNumSpan.style.margin = "0 10px";
     container.appendChild(pageNumSpan);
 
-    if (pageDataObject.page < pageDataObject.totalPages) {
+    if (pageDataObject.hasNext) {
         const nextBtn = document.createElement('button');
         nextBtn.innerHTML = 'Next »';
         nextBtn.className = 'btn-secondary btn-small';
         nextBtn.onclick = () => fetchCallback(pageDataObject.page + 1);
         container.appendChild(nextBtn);
     }
-    if (infoContainer) infoContainer.textContent = `Showing page ${pageDataObject.page} of ${pageDataObject.totalPages}. Total items: ${pageDataObject.total || 'N/A'}`;
 }
 
 const tooltipElement = document.getElementById('tooltip');